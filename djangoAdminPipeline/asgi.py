@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoAdminPipeline.settings')
+# Connection settings differ under ASGI, see DATABASE_CONN_MAX_AGE
+os.environ.setdefault('DJANGO_ASGI', 'True')
 
 application = get_asgi_application()
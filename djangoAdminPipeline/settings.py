@@ -42,10 +42,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    
+    'django.contrib.postgres',
 ]
 
 MIDDLEWARE = [
+    # First, so the queries of the other middleware are counted too
+    'polls.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,6 +81,26 @@ WSGI_APPLICATION = 'djangoAdminPipeline.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connection reuse. By default a connection is kept open for
+# DATABASE_CONN_MAX_AGE seconds (0 closes it after every request). With
+# DATABASE_POOL each process keeps a psycopg pool of connections instead,
+# which also suits ASGI, where requests do not stay on one thread; Django
+# does not allow both, so CONN_MAX_AGE is 0 then. The pool needs
+# psycopg[pool]. Health checks test a reused connection (or one taken from
+# the pool) before the request uses it.
+# Under ASGI (DJANGO_ASGI, set by asgi.py) the sync ORM calls of a request
+# run on executor threads, each keeping its own persistent connection that
+# only a request on that thread closes, so idle connections pile up:
+# DATABASE_CONN_MAX_AGE defaults to 0 there, use DATABASE_POOL for reuse.
+DATABASE_POOL = config('DATABASE_POOL', default=False, cast=bool)
+SERVED_BY_ASGI = config('DJANGO_ASGI', default=False, cast=bool)
+DATABASE_POOL_OPTIONS = {
+    "min_size": config('DATABASE_POOL_MIN_SIZE', default=2, cast=int),
+    "max_size": config('DATABASE_POOL_MAX_SIZE', default=10, cast=int),
+    # Seconds a request waits for a free connection
+    "timeout": config('DATABASE_POOL_TIMEOUT', default=10, cast=int),
+}
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -87,9 +109,32 @@ DATABASES = {
         "PASSWORD": config('DATABASE_PASSWORD'),
         "HOST": config('DATABASE_HOST'),
         "PORT": config('DATABASE_PORT'),
+        "CONN_MAX_AGE": 0 if DATABASE_POOL else config(
+            'DATABASE_CONN_MAX_AGE', default=0 if SERVED_BY_ASGI else 60, cast=int),
+        "CONN_HEALTH_CHECKS": config('DATABASE_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        "OPTIONS": {"pool": DATABASE_POOL_OPTIONS} if DATABASE_POOL else {},
+    }
+}
+
+
+# Cache of the hotel API responses (polls.cache) and of the admin filter
+# counts. Local memory is per process, use a shared backend such as Redis or
+# Memcached when running several processes so they see each other's
+# invalidations.
+CACHES = {
+    "default": {
+        "BACKEND": config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": config('CACHE_LOCATION', default=''),
     }
 }
 
+# Seconds a cached hotel response and its version token are kept. A change
+# replaces the response at once in the processes sharing the cache; with
+# the local memory cache the other processes serve theirs until it expires.
+HOTEL_CACHE_TIMEOUT = config('HOTEL_CACHE_TIMEOUT', default=3600, cast=int)
+# Larger list pages are streamed without being cached
+HOTEL_CACHE_MAX_PAGE_SIZE = config('HOTEL_CACHE_MAX_PAGE_SIZE', default=1024 * 1024, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -131,3 +176,57 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Above this many rows the admin shows the planner's estimate instead of
+# running COUNT(*), see polls.pagination.EstimatedCountPaginator
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=100000, cast=int)
+
+# Remove the files of deleted images in a thread right after the commit.
+# Without it the queue is only drained by `manage.py cleanup_media`.
+MEDIA_CLEANUP_IN_BACKGROUND = config('MEDIA_CLEANUP_IN_BACKGROUND', default=True, cast=bool)
+
+# WebP renditions made of every image, see polls.renditions: name and the
+# (width, height) box it is scaled down to fit, None keeps the original size
+IMAGE_RENDITIONS = {
+    'thumbnail': (320, 320),
+    'medium': (1024, 1024),
+    'full': None,
+}
+IMAGE_RENDITION_QUALITY = config('IMAGE_RENDITION_QUALITY', default=80, cast=int)
+# Processes making the renditions of saved images (per web process) and,
+# by default, of imported ones
+IMAGE_RENDITION_WORKERS = config('IMAGE_RENDITION_WORKERS', default=2, cast=int)
+# Make the renditions of saved images in the worker processes instead of
+# in the request, after the commit
+IMAGE_RENDITIONS_IN_BACKGROUND = config('IMAGE_RENDITIONS_IN_BACKGROUND', default=True, cast=bool)
+
+# Front-end server sending the media files once Django checked the access
+# (polls.media): 'nginx' (X-Accel-Redirect to MEDIA_ACCEL_PREFIX, an
+# internal location aliasing MEDIA_ROOT), 'apache' or 'lighttpd'
+# (X-Sendfile), or '' to send them from Django
+MEDIA_SERVER = config('MEDIA_SERVER', default='')
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/protected-media/')
+# Stored files never change content, browsers and proxies may keep them
+MEDIA_CACHE_MAX_AGE = config('MEDIA_CACHE_MAX_AGE', default=365 * 24 * 60 * 60, cast=int)
+
+# Query counts and database time of requests and import_data phases, see
+# polls.instrumentation. Logged as warnings past these limits, as info
+# otherwise; the headers expose them to clients, so keep them to DEBUG.
+QUERY_INSTRUMENTATION_HEADERS = config('QUERY_INSTRUMENTATION_HEADERS', default=DEBUG, cast=bool)
+QUERY_LOG_MAX_QUERIES = config('QUERY_LOG_MAX_QUERIES', default=50, cast=int)
+QUERY_LOG_SLOW_MS = config('QUERY_LOG_SLOW_MS', default=500, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'polls.instrumentation': {
+            'handlers': ['console'],
+            'level': config('QUERY_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
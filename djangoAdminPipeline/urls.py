@@ -17,15 +17,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from django.shortcuts import redirect
+from polls.views import media_file
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("polls/", include("polls.urls")),
     # Redirect root URL to admin
     path('', lambda request: redirect('admin:index')),
+    # Image files, after an access check, see polls.media
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:name>", media_file, name='media'),
 ]
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
-                          document_root=settings.MEDIA_ROOT)
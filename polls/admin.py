@@ -1,15 +1,35 @@
 from django import forms
 from django.contrib import admin
-from polls.models import HotelInformation, Images, Amenities, Location
+from django.contrib.admin.views.main import ORDER_VAR
+from django.db import connection
+from django.db.models import Prefetch, Q
+from django.template.defaultfilters import filesizeformat
+from django.utils.html import format_html
+from polls.filters import TopRelatedFieldListFilter
+from polls.models import HotelInformation, Images, Amenities, Location, ImportCheckpoint
+from polls.pagination import EstimatedCountPaginator, KeysetChangeList
 import os
 
 class ImagesInline(admin.TabularInline):
     model = Images
     extra = 1
     max_num = 10
-    exclude = ('updateDate',)
+    exclude = ('updateDate', 'width', 'height', 'fileSize', 'format', 'contentHash')
     can_delete = True
 
+class HotelSearchMixin:
+    """
+    Searches the related hotels through the full text index of
+    HotelInformation instead of a title ILIKE join, on PostgreSQL.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or connection.vendor != 'postgresql':
+            return super().get_search_results(request, queryset, search_term)
+        hotels = HotelInformation.objects.search(search_term).values('pk')
+        return queryset.filter(Q(name__icontains=search_term) | Q(hotels__in=hotels)), True
+
+
 class HotelInformationAdmin(admin.ModelAdmin):
     inlines = [ImagesInline]
     list_display = ('title', 'description', 'get_locations',
@@ -17,18 +37,35 @@ class HotelInformationAdmin(admin.ModelAdmin):
     exclude = ('updateDate',)
     search_fields = ['title']
     filter_horizontal = ('locations', 'amenities')
-    list_filter = ('createDate', 'updateDate', 'locations', 'amenities')  # Added filter
-
+    list_filter = ('createDate', 'updateDate',
+                   ('locations', TopRelatedFieldListFilter),
+                   ('amenities', TopRelatedFieldListFilter))  # Added filter
+    ordering = KeysetChangeList.keyset_ordering
+    # Estimated counts for large tables, and no second COUNT(*) for the total
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # One query per relation for the whole page instead of an exists()
+        # and an all() query per row and column
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('locations', queryset=Location.objects.only('id', 'name')),
+            Prefetch('amenities', queryset=Amenities.objects.only('id', 'name')),
+            Prefetch('images', queryset=Images.objects.only('id', 'hotel_id', 'image')),
+        )
+
+    # The methods below only read the prefetched relations, calling
+    # exists() or filter() on them would query the database again
     def get_locations(self, obj):
-        return ", ".join([location.name for location in obj.locations.all()]) if obj.locations.exists() else "No Locations"
+        return ", ".join([location.name for location in obj.locations.all()]) or "No Locations"
     get_locations.short_description = 'Locations'
 
     def get_amenities(self, obj):
-        return ", ".join([amenity.name for amenity in obj.amenities.all()]) if obj.amenities.exists() else "No Amenities"
+        return ", ".join([amenity.name for amenity in obj.amenities.all()]) or "No Amenities"
     get_amenities.short_description = 'Amenities'
 
     def get_images(self, obj):
-        return ", ".join([os.path.basename(image.image.name) for image in obj.images.all()]) if obj.images.exists() else "No Images"
+        return ", ".join([os.path.basename(image.image.name) for image in obj.images.all()]) or "No Images"
     get_images.short_description = 'Images'
 
     def save_model(self, request, obj, form, change):
@@ -45,51 +82,111 @@ class HotelInformationAdmin(admin.ModelAdmin):
             )
             obj.locations.add(location)
 
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # Full text index with trigram fallback instead of title ILIKE. The
+        # changelist orders the rows before the search annotates the rank,
+        # so best matches first is set here, unless a column is sorted.
+        if not search_term or connection.vendor != 'postgresql':
+            return super().get_search_results(request, queryset, search_term)
+        queryset = queryset.search(search_term)
+        if not request.GET.get(ORDER_VAR):
+            queryset = queryset.order_by('-rank', '-pk')
+        return queryset, False
+
     def delete_queryset(self, request, queryset):
-        for obj in queryset:
-            obj.delete()  # This will trigger the delete method in the model
+        # Set-based delete, the image files are removed after the commit
+        queryset.delete_with_media()
 
 class ImageInformationAdmin(admin.ModelAdmin):
-    list_display = ('image_name', 'hotel', 'createDate', 'updateDate')
+    list_display = ('thumbnail', 'image_name', 'hotel', 'dimensions', 'size', 'createDate', 'updateDate')
+    list_select_related = ('hotel',)
     search_fields = ['image']
     exclude = ('updateDate',)
-    list_filter = ('createDate', 'updateDate', 'hotel')  # Added filter
+    # Read from the file when it is saved
+    readonly_fields = ('width', 'height', 'fileSize', 'format', 'contentHash')
+    list_filter = ('createDate', 'updateDate', ('hotel', TopRelatedFieldListFilter))  # Added filter
+    ordering = KeysetChangeList.keyset_ordering
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
 
     def image_name(self, obj):
         return os.path.basename(obj.image.name) if obj.image else "No image"
     image_name.short_description = 'Image'
 
+    def thumbnail(self, obj):
+        # The small WebP rendition, not the original
+        if not obj.image:
+            return ""
+        return format_html('<img src="{}" alt="" style="max-height: 60px" loading="lazy">',
+                           obj.rendition_url('thumbnail'))
+    thumbnail.short_description = 'Preview'
+
+    def dimensions(self, obj):
+        return f"{obj.width} × {obj.height}" if obj.width else "-"
+    dimensions.short_description = 'Dimensions'
+
+    def size(self, obj):
+        return filesizeformat(obj.fileSize) if obj.fileSize is not None else "-"
+    size.short_description = 'Size'
+    size.admin_order_field = 'fileSize'
+
     def hotel(self, obj):
         return obj.hotel.title if obj.hotel else "No Hotel"
     hotel.short_description = 'Hotel'
 
     def delete_queryset(self, request, queryset):
-        for obj in queryset:
-            obj.delete()  # This will trigger the delete method in the model
+        # Set-based delete, the image files are removed after the commit
+        queryset.delete_with_media()
 
-class LocationInformationAdmin(admin.ModelAdmin):
+class LocationInformationAdmin(HotelSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'type', 'get_hotels', 'latitude',
                     'longitude', 'createDate', 'updateDate')
     search_fields = ['name', 'hotels__title']
     exclude = ('updateDate',)
     list_filter = ('type', 'createDate', 'updateDate')  # Added filter
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('hotels', queryset=HotelInformation.objects.only('id', 'title')))
 
     def get_hotels(self, obj):
-        return ", ".join([hotel.title for hotel in obj.hotels.all()]) if obj.hotels.exists() else "No Hotels"
+        return ", ".join([hotel.title for hotel in obj.hotels.all()]) or "No Hotels"
     get_hotels.short_description = 'Hotels'
 
-class AmenitiesInformationAdmin(admin.ModelAdmin):
+class AmenitiesInformationAdmin(HotelSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'get_hotels', 'createDate', 'updateDate')
     search_fields = ['name', 'hotels__title']
     exclude = ('updateDate',)
     list_filter = ('createDate', 'updateDate')  # Added filter
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('hotels', queryset=HotelInformation.objects.only('id', 'title')))
 
     def get_hotels(self, obj):
-        return ", ".join([hotel.title for hotel in obj.hotels.all()]) if obj.hotels.exists() else "No Hotels"
+        return ", ".join([hotel.title for hotel in obj.hotels.all()]) or "No Hotels"
     get_hotels.short_description = 'Hotels'
 
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('source', 'keyColumn', 'lastKey', 'lastId', 'status', 'batchNumber',
+                    'rowsProcessed', 'createDate', 'updateDate')
+    search_fields = ['source']
+    list_filter = ('status',)
+    exclude = ('updateDate',)
+
 # Register the models with the customized admin classes
 admin.site.register(HotelInformation, HotelInformationAdmin)
 admin.site.register(Images, ImageInformationAdmin)
 admin.site.register(Location, LocationInformationAdmin)
-admin.site.register(Amenities, AmenitiesInformationAdmin)
\ No newline at end of file
+admin.site.register(Amenities, AmenitiesInformationAdmin)
+admin.site.register(ImportCheckpoint, ImportCheckpointAdmin)
@@ -0,0 +1,436 @@
+"""
+Synthetic data and benchmarks of the import, the admin and the search.
+
+``SyntheticData`` makes a seeded, repeatable set of hotels with the shape
+of the scrapy data: cities shared by many hotels (a few big ones, a long
+tail of small ones), several neighbourhood locations per city, a dozen
+amenities and a few images per hotel out of a smaller set of files, and
+one source row per room type. ``generate_benchmark_data`` writes it as a
+scrapy source table, as image files and/or straight into the polls tables;
+``run_benchmarks`` times the import, the admin pages and the search on it.
+"""
+import io
+import os
+import random
+import statistics
+import time
+from urllib.parse import urlencode
+
+import psycopg
+
+from django.contrib import admin
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import resolve, reverse
+from PIL import Image
+
+from polls import cache, geo
+from polls.importer.source import build_count_query, source_pool
+from polls.instrumentation import QueryRecorder, QueryStatistics
+from polls.metadata import path_metadata
+from polls.models import Amenities, HotelInformation, Images, Location, MediaCleanup
+from polls.storage import image_storage
+
+# Terms of the search benchmark: a city, a neighbourhood, an amenity, a
+# hotel name and a misspelt one
+SEARCH_TERMS = ['Dhaka', 'Old Town', 'swimming pool', 'Grand Hotel', 'Grnd Resrt']
+
+# (city, latitude, longitude), from the largest share of the hotels to the smallest
+CITIES = [
+    ("Cox's Bazar", 21.4272, 92.0058), ('Dhaka', 23.8103, 90.4125),
+    ('Bangkok', 13.7563, 100.5018), ('Chittagong', 22.3569, 91.7832),
+    ('Kuala Lumpur', 3.1390, 101.6869), ('Sylhet', 24.8949, 91.8687),
+    ('Singapore', 1.3521, 103.8198), ('Kathmandu', 27.7172, 85.3240),
+    ('Dubai', 25.2048, 55.2708), ('Colombo', 6.9271, 79.8612),
+    ('London', 51.5072, -0.1276), ('Paris', 48.8566, 2.3522),
+    ('Tokyo', 35.6762, 139.6503), ('New York', 40.7128, -74.0060),
+    ('Sydney', -33.8688, 151.2093), ('Reykjavik', 64.1466, -21.9426),
+    # Either side of the antimeridian, where geohash neighbours wrap
+    ('Suva', -18.1248, 178.4501), ('Apia', -13.8507, -171.7514),
+]
+NEIGHBOURHOODS = [
+    'Old Town', 'City Centre', 'Beach Road', 'Airport', 'Riverside',
+    'Station', 'Harbour', 'Market', 'University', 'Lake View', 'Hill Side',
+    'Business District',
+]
+AMENITIES = [
+    'Free WiFi', 'Swimming pool', 'Spa', 'Fitness centre', 'Restaurant',
+    'Bar', 'Room service', '24-hour front desk', 'Airport shuttle',
+    'Free parking', 'Air conditioning', 'Breakfast included', 'Family rooms',
+    'Non-smoking rooms', 'Pet friendly', 'Laundry', 'Elevator', 'Sauna',
+    'Beachfront', 'Garden', 'Terrace', 'Hot tub', 'Kids club', 'Concierge',
+    'Business centre', 'Meeting rooms', 'Electric vehicle charging',
+    'Bicycle rental', 'Car rental', 'Currency exchange', 'Tour desk',
+    'Luggage storage', 'Minibar', 'Safe', 'Kitchenette', 'Balcony',
+    'Sea view', 'City view', 'Wheelchair accessible', 'Rooftop pool',
+]
+NAMES = [
+    'Grand', 'Royal', 'Ocean', 'Sea Pearl', 'Golden', 'Blue Lagoon', 'Palm',
+    'Silver Sands', 'Heritage', 'Lotus', 'Emerald', 'Sunrise', 'Crown',
+    'Harbour Light', 'Marina', 'Orchid', 'Imperial', 'Garden', 'Regency',
+    'Coral', 'Summit', 'Riverview', 'Maple', 'Cedar', 'Horizon',
+]
+KINDS = ['Hotel', 'Resort', 'Inn', 'Suites', 'Residency', 'Lodge', 'Guest House', 'Hotel & Spa']
+ROOM_TYPES = ['Standard Room', 'Deluxe Room', 'Superior Double', 'Family Suite',
+              'Executive Suite', 'Twin Room', 'Ocean View Room']
+SENTENCES = [
+    '{title} is a {kind} in {neighbourhood}, {city}.',
+    'Guests enjoy {amenity_a} and {amenity_b}.',
+    'It is {minutes} minutes from the centre of {city}.',
+    'Rooms come with {amenity_a}, and the {kind} also offers {amenity_b}.',
+    'A favourite of families visiting {city}.',
+    'Rated {rating} by guests for its location in {neighbourhood}.',
+]
+
+
+class SyntheticData:
+    """
+    ``hotels`` synthetic hotels made from ``seed``. The same arguments
+    always give the same hotels, so runs on separate days or machines
+    benchmark the same data. Images are picked from ``image_names``, the
+    files written by ``write_images``.
+    """
+
+    def __init__(self, hotels, seed=0, distinct_images=200):
+        self.hotels = hotels
+        self.seed = seed
+        self.image_names = [f'image_{number:05d}.jpg' for number in range(1, distinct_images + 1)]
+        # About 20 hotels per city on average, few cities for small runs
+        cities = max(min(hotels // 20, len(CITIES)), 1)
+        self.cities = CITIES[:cities]
+        self.city_weights = [1 / rank for rank in range(1, cities + 1)]
+
+    def __iter__(self):
+        """Yield each hotel as a dict of its fields and relations."""
+        rng = random.Random(self.seed)
+        titles = set()
+        for number in range(self.hotels):
+            city, latitude, longitude = rng.choices(self.cities, self.city_weights)[0]
+            kind = rng.choice(KINDS)
+            locations = [self.neighbourhood(city, latitude, longitude, rng)
+                         for _ in range(rng.choice((1, 1, 1, 2)))]
+            title = f'{rng.choice(NAMES)} {kind} {locations[0][0].split(",")[0]}'
+            if title in titles:
+                title = f'{title} {number}'
+            titles.add(title)
+            amenities = rng.sample(AMENITIES, rng.randint(3, 12))
+            rating = round(rng.uniform(2.5, 5), 1)
+            text = {
+                'title': title, 'kind': kind.lower(), 'city': city,
+                'neighbourhood': locations[0][0].split(',')[0],
+                'amenity_a': amenities[0].lower(), 'amenity_b': amenities[1].lower(),
+                'minutes': rng.randint(2, 45), 'rating': rating,
+            }
+            description = ' '.join(
+                sentence.format(**text) for sentence in rng.sample(SENTENCES, rng.randint(2, 4)))
+            yield {
+                'title': title,
+                'description': description,
+                'locations': locations,
+                'amenities': amenities,
+                # Mostly a handful, some hotels have none
+                'images': rng.sample(self.image_names, min(
+                    rng.choice((0, 1, 2, 3, 4, 4, 5, 6, 8)), len(self.image_names))),
+                'room_types': rng.sample(ROOM_TYPES, rng.randint(1, 3)),
+                'rating': rating,
+                'price': round(rng.uniform(25, 450), 2),
+            }
+
+    @staticmethod
+    def neighbourhood(city, latitude, longitude, rng):
+        # A fixed point per neighbourhood, so locations are shared by hotels
+        index = rng.randrange(len(NEIGHBOURHOODS))
+        offset = random.Random(f'{city}{index}')
+        return (f'{NEIGHBOURHOODS[index]}, {city}',
+                round(latitude + offset.uniform(-0.08, 0.08), 6),
+                round((longitude + offset.uniform(-0.08, 0.08) + 180) % 360 - 180, 6))
+
+    def source_rows(self):
+        """
+        Rows of the scrapy ``public.hotels`` table, in the column order of
+        ``polls.importer.source.SOURCE_COLUMNS``: one per room type, the
+        first location only. Hotels without images are skipped, the
+        importer rejects such rows.
+        """
+        for hotel in self:
+            if not hotel['images']:
+                continue
+            name, latitude, longitude = hotel['locations'][0]
+            for room_type in hotel['room_types']:
+                yield (hotel['title'], latitude, longitude, name, hotel['rating'],
+                       hotel['price'], room_type, hotel['images'])
+
+
+SOURCE_TABLE = """
+    CREATE TABLE IF NOT EXISTS public.hotels (
+        id serial PRIMARY KEY,
+        "propertyTitle" text,
+        latitude double precision,
+        longitude double precision,
+        location text,
+        rating double precision,
+        price double precision,
+        "roomType" text,
+        images text[]
+    )
+"""
+
+
+def write_source(conninfo, rows, replace=False):
+    """
+    Create the scrapy ``public.hotels`` table in the database of
+    ``conninfo`` and COPY ``rows`` into it. Returns the number of rows, or
+    None when the table has rows and ``replace`` is not set.
+    """
+    with psycopg.connect(conninfo) as conn, conn.cursor() as cursor:
+        cursor.execute(SOURCE_TABLE)
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM public.hotels)')
+        if cursor.fetchone()[0]:
+            if not replace:
+                return None
+            cursor.execute('TRUNCATE public.hotels RESTART IDENTITY')
+        written = 0
+        with cursor.copy(
+                'COPY public.hotels ("propertyTitle", latitude, longitude, location, '
+                'rating, price, "roomType", images) FROM STDIN') as copy:
+            for row in rows:
+                copy.write_row(row)
+                written += 1
+    return written
+
+
+def write_images(directory, names, size=(1600, 1200), seed=0, replace=False):
+    """
+    Write a JPEG of ``size`` pixels for each of ``names`` into
+    ``directory``, made from ``seed`` and the name so reruns write the same
+    bytes. Smooth colour areas with fine grain, so they compress about like
+    photos. Returns how many were written, existing files are kept.
+    """
+    os.makedirs(directory, exist_ok=True)
+    width, height = size
+    written = 0
+    for name in names:
+        path = os.path.join(directory, name)
+        if os.path.exists(path) and not replace:
+            continue
+        rng = random.Random(f'{seed}{name}')
+        colours = Image.frombytes('RGB', (8, 6), rng.randbytes(8 * 6 * 3))
+        image = colours.resize(size, Image.Resampling.BICUBIC)
+        grain = Image.frombytes('L', (width // 4, height // 4), rng.randbytes(width // 4 * (height // 4)))
+        grain = grain.resize(size, Image.Resampling.BILINEAR).convert('RGB')
+        image = Image.blend(image, grain, 0.15)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        # Written whole or not at all, an interrupted run leaves no truncated file
+        with open(f'{path}.part', 'wb') as file:
+            file.write(buffer.getvalue())
+        os.replace(f'{path}.part', path)
+        written += 1
+    return written
+
+
+def populate(data, images_dir, batch_size=1000):
+    """
+    Insert ``data`` straight into the polls tables with ``bulk_create``,
+    without going through the import, and store the image files of
+    ``images_dir`` it uses. Returns the counts of rows created.
+    """
+    counts = {'hotels': 0, 'locations': 0, 'amenities': 0, 'images': 0}
+    existing = Amenities.objects.count()
+    Amenities.objects.bulk_create([Amenities(name=name) for name in AMENITIES], ignore_conflicts=True)
+    counts['amenities'] = Amenities.objects.count() - existing
+    amenities = dict(Amenities.objects.filter(name__in=AMENITIES).values_list('name', 'pk'))
+
+    stored = {}
+    for name in data.image_names:
+        path = os.path.join(images_dir, name)
+        if images_dir and os.path.isfile(path):
+            with open(path, 'rb') as file:
+                stored[name] = (image_storage.save(f'images/{name}', File(file, name)),
+                                path_metadata(path))
+
+    locations = {}
+    hotels = iter(data)
+    while True:
+        batch = [hotel for _, hotel in zip(range(batch_size), hotels)]
+        if not batch:
+            break
+        with transaction.atomic():
+            counts['locations'] += create_locations(batch, locations)
+            created = HotelInformation.objects.bulk_create([
+                HotelInformation(title=hotel['title'], description=hotel['description'])
+                for hotel in batch])
+            counts['hotels'] += len(created)
+            LocationLink = HotelInformation.locations.through
+            AmenityLink = HotelInformation.amenities.through
+            LocationLink.objects.bulk_create([
+                LocationLink(hotelinformation_id=row.pk, location_id=locations[location])
+                for row, hotel in zip(created, batch) for location in hotel['locations']],
+                ignore_conflicts=True)
+            AmenityLink.objects.bulk_create([
+                AmenityLink(hotelinformation_id=row.pk, amenities_id=amenities[amenity])
+                for row, hotel in zip(created, batch) for amenity in hotel['amenities']])
+            images = Images.objects.bulk_create([
+                Images(image=stored[name][0], hotel_id=row.pk, **stored[name][1]._asdict())
+                for row, hotel in zip(created, batch) for name in hotel['images']
+                if name in stored])
+            counts['images'] += len(images)
+            HotelInformation.objects.filter(pk__in=[row.pk for row in created]).update_search_vectors()
+    cache.invalidate_all_hotels()
+    return counts
+
+
+def clear_data():
+    """
+    Delete the hotels, images and locations, and their files. The files
+    are removed before returning, so a new run storing the same content
+    does not race the background cleanup.
+    """
+    with override_settings(MEDIA_CLEANUP_IN_BACKGROUND=False):
+        HotelInformation.objects.all().delete_with_media()
+        Images.objects.all().delete_with_media()
+        Location.objects.all().delete()
+    MediaCleanup.process()
+
+
+def create_locations(hotels, locations):
+    keys = {location for hotel in hotels for location in hotel['locations']} - set(locations)
+    if not keys:
+        return 0
+    Location.objects.bulk_create([
+        Location(name=name, latitude=latitude, longitude=longitude,
+                 geohash=geo.encode(latitude, longitude))
+        for name, latitude, longitude in keys], ignore_conflicts=True)
+    # Fetched back, ignore_conflicts gives no primary keys
+    names = {name for name, _, _ in keys}
+    for location in Location.objects.filter(name__in=names).values_list(
+            'name', 'latitude', 'longitude', 'pk'):
+        locations[location[:3]] = location[3]
+    return len(keys)
+
+
+def measure(run, repeat=5, warmup=1):
+    """
+    Call ``run`` ``warmup`` times untimed, then ``repeat`` times. Returns
+    the min, median and max in milliseconds and the queries of the last
+    call. ``run`` may return the size of what it produced, the bytes of a
+    page or the rows of a query.
+    """
+    for _ in range(warmup):
+        run()
+    timings = []
+    for _ in range(repeat):
+        with QueryRecorder() as queries:
+            start = time.perf_counter()
+            size = run()
+            timings.append((time.perf_counter() - start) * 1000)
+    result = {
+        'ms': {'min': round(min(timings), 2), 'median': round(statistics.median(timings), 2),
+               'max': round(max(timings), 2)},
+        'queries': queries.count,
+        'query_ms': round(queries.seconds * 1000, 2),
+        'duplicates': queries.duplicate_count,
+    }
+    if size is not None:
+        result['size'] = size
+    return result
+
+
+def admin_page(path, user):
+    """
+    Render the admin page at ``path`` for ``user`` through its URL pattern
+    and the admin site's view wrapper, without the middleware. Returns the
+    size of the page.
+    """
+    request = RequestFactory().get(path)
+    request.user = user
+    request.resolver_match = match = resolve(request.path_info)
+    response = match.func(request, *match.args, **match.kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    if response.status_code != 200:
+        raise CommandError(f'{path} answered {response.status_code}.')
+    return len(response.content)
+
+
+def benchmark_user():
+    # Never saved, the admin only checks the flags
+    return User(username='benchmark', is_active=True, is_staff=True, is_superuser=True)
+
+
+def admin_benchmarks(repeat=5):
+    """The changelist and the change view of the first row of every polls admin."""
+    user = benchmark_user()
+    results = {}
+    for model in admin.site._registry:
+        opts = model._meta
+        if opts.app_label != 'polls':
+            continue
+        name = f'admin.{opts.model_name}'
+        changelist = reverse(f'admin:polls_{opts.model_name}_changelist')
+        results[f'{name}.changelist'] = measure(lambda: admin_page(changelist, user), repeat)
+        first = model.objects.order_by('pk').values_list('pk', flat=True).first()
+        if first is not None:
+            change = reverse(f'admin:polls_{opts.model_name}_change', args=[first])
+            results[f'{name}.change'] = measure(lambda: admin_page(change, user), repeat)
+    return results
+
+
+def search_benchmarks(terms=SEARCH_TERMS, repeat=5):
+    """
+    The hotel changelist searched for each of ``terms``, and on PostgreSQL
+    the top 20 results of ``HotelInformation.objects.search``.
+    """
+    user = benchmark_user()
+    changelist = reverse('admin:polls_hotelinformation_changelist')
+    results = {}
+    for term in terms:
+        path = f'{changelist}?{urlencode({SEARCH_VAR: term})}'
+        results[f'search.admin.{term}'] = measure(lambda: admin_page(path, user), repeat)
+        if connection.vendor == 'postgresql':
+            results[f'search.orm.{term}'] = measure(
+                lambda: len(HotelInformation.objects.search(term)[:20]), repeat)
+    return results
+
+
+def import_benchmark(backend, options, reset=False):
+    """
+    Time one ``import_data`` run with ``backend`` and the ``options`` of
+    the command. With ``reset`` the polls data is deleted first, so every
+    row is new; otherwise it measures an import of rows that exist already.
+    Queries are only counted on this process's connection, not on the
+    workers of ``--processes`` or the file copy threads.
+    """
+    if reset:
+        clear_data()
+    with source_pool(options['source_dsn']).connection() as conn, conn.cursor() as cursor:
+        cursor.execute(*build_count_query())
+        rows, titles, image_references = cursor.fetchone()
+    hotels, images = HotelInformation.objects.count(), Images.objects.count()
+    output = io.StringIO()
+    # Totals only, an import runs queries in proportion to the rows
+    with QueryStatistics() as queries:
+        start = time.perf_counter()
+        call_command('import_data', backend=backend, interactive=False,
+                     stdout=output, **options)
+        seconds = time.perf_counter() - start
+    if 'Successfully imported' not in output.getvalue():
+        raise CommandError(f'import_data failed:\n{output.getvalue()}')
+    return {
+        'seconds': round(seconds, 3),
+        'reset': reset,
+        'rows': rows,
+        'rows_per_second': round(rows / seconds, 1),
+        'image_references': image_references,
+        'hotels_created': HotelInformation.objects.count() - hotels,
+        'images_created': Images.objects.count() - images,
+        'queries': queries.count,
+        'query_ms': round(queries.seconds * 1000, 2),
+        'statements': len(queries.statements),
+    }
@@ -0,0 +1,171 @@
+"""
+Versioned cache of the hotel API responses.
+
+Every hotel has a version token in the cache, the hotel lists share one,
+and a generation token covers all of them. Cached entries are keyed on the
+tokens: a change only writes a new token (after the commit, see
+``invalidate_hotels``), and entries of older versions are never read again
+and expire on their own. Tokens expire with the entries,
+``HOTEL_CACHE_TIMEOUT``, so with a cache per process (local memory), where
+a change made by another process does not reach this one's tokens, an
+entry is at most that old.
+
+The validators come from the content, not from the tokens, so every
+process gives the same ones and an entry rendered again after a change
+gets new ones: the ``ETag`` is a hash of the body, ``Last-Modified`` the
+latest change of the hotel and its related rows in the database
+(``HotelInformationQuerySet.with_last_change``). List pages only have an
+``ETag``, once cached. Reading the tokens and the entry costs no database
+query, so a repeated read, or a conditional GET answered with 304, does
+not touch the database.
+"""
+import hashlib
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+GENERATION_KEY = 'polls:hotels:generation'
+LIST_KEY = 'polls:hotels:list'
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'last_modified'])
+
+
+def hotel_key(pk):
+    return f'polls:hotel:{pk}:version'
+
+
+def get_tokens(keys):
+    """Current tokens of ``keys``, starting a version for the ones that have none."""
+    tokens = cache.get_many(keys)
+    for key in keys:
+        if key not in tokens:
+            token = time.time_ns()
+            # Another process may have started it meanwhile
+            if not cache.add(key, token, settings.HOTEL_CACHE_TIMEOUT):
+                token = cache.get(key, token)
+            tokens[key] = token
+    return [tokens[key] for key in keys]
+
+
+async def aget_tokens(keys):
+    tokens = await cache.aget_many(keys)
+    for key in keys:
+        if key not in tokens:
+            token = time.time_ns()
+            if not await cache.aadd(key, token, settings.HOTEL_CACHE_TIMEOUT):
+                token = await cache.aget(key, token)
+            tokens[key] = token
+    return [tokens[key] for key in keys]
+
+
+def invalidate_hotels(pks):
+    """New versions for these hotels and the hotel lists, once the transaction commits."""
+    keys = [hotel_key(pk) for pk in pks]
+    keys.append(LIST_KEY)
+    transaction.on_commit(
+        lambda: cache.set_many(dict.fromkeys(keys, time.time_ns()), settings.HOTEL_CACHE_TIMEOUT))
+
+
+def invalidate_all_hotels():
+    """New versions for every hotel, for bulk writes that send no signals."""
+    transaction.on_commit(
+        lambda: cache.set(GENERATION_KEY, time.time_ns(), settings.HOTEL_CACHE_TIMEOUT))
+
+
+def digest(value):
+    return hashlib.md5(value.encode()).hexdigest()[:12]
+
+
+def hotel_entry_key(pk, generation, version, variant):
+    return f'polls:hotel:{pk}:{generation}:{version}:{digest(variant)}'
+
+
+def make_entry(body, changed=None):
+    """Entry of ``body``, ``changed`` the datetime of the last change it shows."""
+    return CachedResponse(body, f'"{digest(body)}"', changed.timestamp() if changed else None)
+
+
+def get_hotel(pk, variant, render):
+    """
+    ``CachedResponse`` of hotel ``pk``. ``variant`` tells the renderings
+    apart (e.g. the fields asked for), ``render()`` returns the body and
+    the last change of the hotel and its related rows on a miss.
+    """
+    generation, version = get_tokens([GENERATION_KEY, hotel_key(pk)])
+    key = hotel_entry_key(pk, generation, version, variant)
+    entry = cache.get(key)
+    if entry is None:
+        entry = make_entry(*render())
+        cache.set(key, entry, settings.HOTEL_CACHE_TIMEOUT)
+    return entry
+
+
+async def aget_hotel(pk, variant, render):
+    """``get_hotel`` for async views, ``render`` is a coroutine function."""
+    generation, version = await aget_tokens([GENERATION_KEY, hotel_key(pk)])
+    key = hotel_entry_key(pk, generation, version, variant)
+    entry = await cache.aget(key)
+    if entry is None:
+        entry = make_entry(*await render())
+        await cache.aset(key, entry, settings.HOTEL_CACHE_TIMEOUT)
+    return entry
+
+
+def list_key(generation, version, variant):
+    return f'polls:hotels:{generation}:{version}:{digest(variant)}'
+
+
+def hotel_list_key(variant):
+    """Cache key of the current version of a page of the hotel list."""
+    return list_key(*get_tokens([GENERATION_KEY, LIST_KEY]), variant)
+
+
+async def ahotel_list_key(variant):
+    return list_key(*await aget_tokens([GENERATION_KEY, LIST_KEY]), variant)
+
+
+def get_page(key):
+    """``CachedResponse`` of a page, ``None`` when it is not cached."""
+    return cache.get(key)
+
+
+async def aget_page(key):
+    return await cache.aget(key)
+
+
+def cache_stream(key, chunks):
+    """
+    Pass the ``chunks`` of a page through and cache their concatenation
+    (a ``CachedResponse``) under ``key`` once they are all sent, unless it grows beyond
+    ``settings.HOTEL_CACHE_MAX_PAGE_SIZE`` characters.
+    """
+    collected = []
+    size = 0
+    for chunk in chunks:
+        collected, size = collect(collected, size, chunk)
+        yield chunk
+    if collected is not None:
+        cache.set(key, make_entry(''.join(collected)), settings.HOTEL_CACHE_TIMEOUT)
+
+
+async def acache_stream(key, chunks):
+    collected = []
+    size = 0
+    async for chunk in chunks:
+        collected, size = collect(collected, size, chunk)
+        yield chunk
+    if collected is not None:
+        await cache.aset(key, make_entry(''.join(collected)), settings.HOTEL_CACHE_TIMEOUT)
+
+
+def collect(collected, size, chunk):
+    if collected is None:
+        return None, size
+    collected.append(chunk)
+    size += len(chunk)
+    if size > settings.HOTEL_CACHE_MAX_PAGE_SIZE:
+        return None, size
+    return collected, size
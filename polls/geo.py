@@ -0,0 +1,122 @@
+"""
+Geohash helpers for the spatial queries of ``Location``.
+
+Every location stores the geohash of its coordinates. Points in the same
+geohash cell share its prefix, so the locations in an area are found with
+a few ``LIKE 'prefix%'`` index scans; the exact box or distance test then
+only runs on those candidates. Plain PostgreSQL is enough, no PostGIS.
+"""
+import math
+
+from django.db.models import F, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# About 5 x 5 metres
+PRECISION = 9
+# Most geohash cells a search looks up, the precision is lowered until the
+# area fits in this many
+MAX_CELLS = 32
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """Geohash of a point, ``precision`` characters long."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    """Height and width, in degrees, of the geohash cells of ``precision``."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(south, west, north, east):
+    """
+    Geohashes of the cells covering the box, at the finest precision that
+    needs at most ``MAX_CELLS`` of them. Empty when even one character is
+    too fine, i.e. the box spans a large part of the world.
+    """
+    for precision in range(PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(math.floor((south + 90) / height), math.floor((min(north, 89.999999) + 90) / height) + 1)
+        columns = range(math.floor((west + 180) / width), math.floor((min(east, 179.999999) + 180) / width) + 1)
+        if len(rows) * len(columns) <= MAX_CELLS:
+            return sorted({
+                encode(-90 + (row + 0.5) * height, -180 + (column + 0.5) * width, precision)
+                for row in rows for column in columns
+            })
+    return []
+
+
+def bbox_filter(south, west, north, east, prefix=''):
+    """
+    ``Q`` matching the points in the box. A box with ``west > east`` crosses
+    the antimeridian and is split in two. ``prefix`` is the lookup path of
+    the location, e.g. ``'locations__'``.
+    """
+    if west > east:
+        return (bbox_filter(south, west, north, 180.0, prefix)
+                | bbox_filter(south, -180.0, north, east, prefix))
+    cells = Q()
+    for cell in covering_cells(south, west, north, east):
+        cells |= Q(**{f'{prefix}geohash__startswith': cell})
+    return cells & Q(**{
+        f'{prefix}latitude__gte': south, f'{prefix}latitude__lte': north,
+        f'{prefix}longitude__gte': west, f'{prefix}longitude__lte': east,
+    })
+
+
+def radius_bbox(latitude, longitude, km):
+    """Box ``(south, west, north, east)`` around the circle of ``km`` around the point."""
+    delta_lat = math.degrees(km / EARTH_RADIUS_KM)
+    south = max(latitude - delta_lat, -90.0)
+    north = min(latitude + delta_lat, 90.0)
+    # Near the poles the circle spans every longitude
+    cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+    if south == -90.0 or north == 90.0 or cos_lat < 1e-9:
+        return south, -180.0, north, 180.0
+    delta_lon = delta_lat / cos_lat
+    if delta_lon >= 180.0:
+        return south, -180.0, north, 180.0
+    west = longitude - delta_lon
+    east = longitude + delta_lon
+    # Wrap around the antimeridian, bbox_filter splits the box then
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    return south, west, north, east
+
+
+def distance_km(latitude, longitude, prefix=''):
+    """Haversine distance in km from the point to the row's coordinates, as an expression."""
+    lat1 = math.radians(latitude)
+    lat2 = Radians(F(f'{prefix}latitude'))
+    delta_lat = lat2 - Value(lat1)
+    delta_lon = Radians(F(f'{prefix}longitude')) - Value(math.radians(longitude))
+    a = (Power(Sin(delta_lat / Value(2.0)), Value(2))
+         + Value(math.cos(lat1)) * Cos(lat2) * Power(Sin(delta_lon / Value(2.0)), Value(2)))
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(Least(a, Value(1.0))))
@@ -0,0 +1,210 @@
+import os
+from collections import Counter, namedtuple
+
+from django.db import connection
+from django.db.models.constants import OnConflict
+
+from polls import cache, geo
+from polls.models import HotelInformation, Location, Images
+from polls.metadata import InvalidImage, MetadataPool
+from polls.storage import image_storage, lock_files
+
+CopyJob = namedtuple('CopyJob', ['source', 'destination'])
+
+# First key of the two-key advisory locks taken on hotel titles
+TITLE_LOCK_NAMESPACE = 1886350444
+
+
+class BulkImporter:
+    """
+    Imports cleaned source rows a batch at a time.
+
+    Locations and hotels are resolved with one query per batch, missing rows
+    are inserted with ``bulk_create`` and the M2M and Images rows are written
+    in bulk as well. File copies are not done here, they are returned as
+    ``CopyJob`` items so the caller decides how to run them. The image files
+    are checked and measured on ``metadata_pool``, invalid ones are skipped
+    and listed in ``invalid_images``.
+    """
+
+    def __init__(self, scrapy_images_dir, metadata_pool=None):
+        self.scrapy_images_dir = scrapy_images_dir
+        self.metadata_pool = metadata_pool or MetadataPool(0)
+        self.stats = Counter()
+        self.invalid_images = []
+
+    def import_rows(self, rows):
+        if not rows:
+            return []
+        locations = self.resolve_locations(rows)
+        hotels, created_titles = self.resolve_hotels(rows)
+        self.link_locations(rows, hotels, created_titles, locations)
+        images, copy_jobs, metadata = self.collect_images(rows)
+        self.create_images(images, hotels, metadata)
+        # bulk_create sends no signals, so the new hotels are indexed here
+        HotelInformation.objects.filter(
+            pk__in=[hotels[title] for title in created_titles]).update_search_vectors()
+        cache.invalidate_all_hotels()
+        return copy_jobs
+
+    def resolve_locations(self, rows):
+        keys = {location_key(row) for row in rows}
+        locations = self.fetch_locations(keys)
+        missing = [
+            Location(name=name, latitude=latitude, longitude=longitude,
+                     geohash=geo.encode(latitude, longitude))
+            for name, latitude, longitude in sorted(keys)
+            if (name, latitude, longitude) not in locations
+        ]
+        if missing:
+            # ON CONFLICT DO NOTHING on the (name, latitude, longitude)
+            # constraint, so a location created meanwhile is not an error.
+            # Inserted in key order, so concurrent importers wait on each
+            # other's new rows in the same order instead of deadlocking.
+            self.stats['locations_created'] += insert_new(missing)
+            locations.update(self.fetch_locations(keys - locations.keys()))
+        return locations
+
+    def fetch_locations(self, keys):
+        names = {name for name, latitude, longitude in keys}
+        queryset = Location.objects.filter(name__in=names).values_list(
+            'name', 'latitude', 'longitude', 'pk')
+        return {
+            (name, latitude, longitude): pk
+            for name, latitude, longitude, pk in queryset
+            if (name, latitude, longitude) in keys
+        }
+
+    def resolve_hotels(self, rows):
+        titles = list(dict.fromkeys(row[0] for row in rows))
+        hotels = self.fetch_hotels(titles)
+        missing = [HotelInformation(title=title)
+                   for title in titles if title not in hotels]
+        if missing:
+            # Postgres returns the new primary keys from bulk_create
+            HotelInformation.objects.bulk_create(missing)
+            hotels.update((hotel.title, hotel.pk) for hotel in missing)
+            self.stats['hotels_created'] += len(missing)
+        return hotels, {hotel.title for hotel in missing}
+
+    def fetch_hotels(self, titles):
+        hotels = {}
+        queryset = HotelInformation.objects.filter(
+            title__in=titles).order_by('pk').values_list('title', 'pk')
+        for title, pk in queryset:
+            hotels.setdefault(title, pk)
+        return hotels
+
+    def link_locations(self, rows, hotels, created_titles, locations):
+        # Like the row by row import, only a newly created hotel gets the
+        # location of the first row it was seen in.
+        Through = HotelInformation.locations.through
+        links = {}
+        for row in rows:
+            title = row[0]
+            if title in created_titles and title not in links:
+                links[title] = Through(
+                    hotelinformation_id=hotels[title],
+                    location_id=locations[location_key(row)],
+                )
+        if links:
+            Through.objects.bulk_create(links.values(), ignore_conflicts=True)
+
+    def collect_images(self, rows):
+        """
+        Return the ``(title, image)`` pairs of the valid image files in the
+        scrapy directory, the jobs copying the ones not stored yet, and the
+        ``ImageMetadata`` of each image. The files of the batch are inspected
+        together on the metadata pool. Images are named by content, so a
+        file already stored under another name is not copied again.
+        """
+        sources = {}
+        for row in rows:
+            for image_name in row[7]:
+                sources.setdefault(os.path.join(self.scrapy_images_dir, image_name), image_name)
+        found = [source for source in sources if os.path.isfile(source)]
+        self.stats['images_missing'] += len(sources) - len(found)
+
+        names = {}
+        metadata = {}
+        for source, result in self.metadata_pool.inspect(found).items():
+            if isinstance(result, InvalidImage):
+                self.stats['images_invalid'] += 1
+                self.invalid_images.append((source, result))
+                continue
+            names[source] = image_storage.hashed_name(
+                f'images/{sources[source]}', result.contentHash)
+            metadata[names[source]] = result
+
+        # Until the batch commits, so MediaCleanup does not remove a file
+        # found below before the rows pointing at it exist
+        lock_files(set(names.values()))
+        images = {}
+        copy_jobs = {}
+        for row in rows:
+            for image_name in row[7]:
+                source = os.path.join(self.scrapy_images_dir, image_name)
+                if source not in names:
+                    continue
+                image = names[source]
+                images[(row[0], image)] = None
+                destination = image_storage.path(image)
+                if destination not in copy_jobs and not os.path.isfile(destination):
+                    copy_jobs[destination] = CopyJob(source, destination)
+        return list(images), list(copy_jobs.values()), metadata
+
+    def create_images(self, images, hotels, metadata):
+        wanted = {(hotels[title], image) for title, image in images}
+        existing = set(Images.objects.filter(
+            hotel_id__in={hotel_id for hotel_id, image in wanted},
+        ).values_list('hotel_id', 'image'))
+        missing = [Images(hotel_id=hotel_id, image=image, **metadata[image]._asdict())
+                   for hotel_id, image in wanted if (hotel_id, image) not in existing]
+        if missing:
+            # A concurrent worker may have added the same image meanwhile
+            self.stats['images_created'] += insert_new(missing)
+
+
+def insert_new(objs):
+    """
+    Insert ``objs`` like ``bulk_create(ignore_conflicts=True)``, skipping
+    the ones that conflict with existing rows, and return the number of
+    rows inserted. ``bulk_create`` tells nothing with ``ignore_conflicts``,
+    so the new primary keys are asked for with ``RETURNING``, which has no
+    row for a skipped one.
+    """
+    model = type(objs[0])
+    opts = model._meta
+    fields = [field for field in opts.concrete_fields
+              if not field.generated and field is not opts.auto_field]
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    inserted = 0
+    for start in range(0, len(objs), batch_size):
+        rows = model._base_manager._insert(
+            objs[start:start + batch_size], fields=fields,
+            returning_fields=[opts.pk], on_conflict=OnConflict.IGNORE)
+        # A single skipped row comes back as None
+        inserted += sum(row is not None for row in rows)
+    return inserted
+
+
+def location_key(row):
+    return row[3], float(row[1]), float(row[2])
+
+
+def lock_titles(titles):
+    """
+    Take transaction level advisory locks on the given hotel titles, in a
+    fixed order so concurrent importers can not deadlock. Titles have no
+    unique constraint, so this is what keeps two import workers from
+    creating the same hotel twice. Must run inside the batch transaction.
+    """
+    if connection.vendor != 'postgresql' or not titles:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, key) FROM ('
+            ' SELECT DISTINCT hashtext(title) AS key'
+            ' FROM unnest(%s::text[]) AS title ORDER BY key'
+            ') AS keys',
+            [TITLE_LOCK_NAMESPACE, list(titles)])
@@ -0,0 +1,110 @@
+import os
+import shutil
+import threading
+
+from polls.pools import WorkerPool
+
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def copy_file(source, destination):
+    """
+    Copy ``source`` to ``destination`` together with its metadata, like
+    ``shutil.copy2``. The data is moved with ``copy_file_range`` or
+    ``sendfile`` when the kernel supports it, so it never passes through
+    user space. The file is written under a temporary name first, so a
+    destination that exists is always complete.
+    """
+    partial = f'{destination}.{os.getpid()}.{threading.get_ident()}.part'
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        with open(source, 'rb') as src, open(partial, 'wb') as dst:
+            size = os.fstat(src.fileno()).st_size
+            offset = 0
+            for copy in (_copy_file_range, _sendfile, _read_write):
+                if offset >= size:
+                    break
+                offset = copy(src.fileno(), dst.fileno(), offset, size)
+        shutil.copystat(source, partial)
+        os.replace(partial, destination)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+# Each helper copies from ``offset`` until ``size`` (or until the system call
+# is not supported for these files) and returns how far it got, so the next
+# one can carry on from there.
+
+def _copy_file_range(src_fd, dst_fd, offset, size):
+    if not hasattr(os, 'copy_file_range'):
+        return offset
+    while offset < size:
+        try:
+            sent = os.copy_file_range(
+                src_fd, dst_fd, min(size - offset, CHUNK_SIZE), offset)
+        except OSError:
+            break
+        if not sent:
+            break
+        offset += sent
+    return offset
+
+
+def _sendfile(src_fd, dst_fd, offset, size):
+    if not hasattr(os, 'sendfile'):
+        return offset
+    while offset < size:
+        try:
+            sent = os.sendfile(dst_fd, src_fd, offset, min(size - offset, CHUNK_SIZE))
+        except OSError:
+            break
+        if not sent:
+            break
+        offset += sent
+    return offset
+
+
+def _read_write(src_fd, dst_fd, offset, size):
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    while True:
+        data = os.read(src_fd, 1024 * 1024)
+        if not data:
+            break
+        os.write(dst_fd, data)
+        offset += len(data)
+    return offset
+
+
+class ImageCopyPool(WorkerPool):
+    """
+    Copies ``CopyJob`` items on a pool of threads while the caller keeps
+    working on the database, see ``WorkerPool``. ``on_stored`` is called
+    with the destination of every job whose file is in place, copied or
+    already there. ``errors`` lists ``(source, error)``.
+    """
+
+    thread_name_prefix = 'image-copy'
+
+    def __init__(self, workers=4, max_pending=None, on_stored=None):
+        super().__init__(workers, max_pending)
+        self.on_stored = on_stored
+
+    def submit(self, job):
+        self.run(job, store, job)
+
+    def completed(self, job, result):
+        self.count(result)
+        if self.on_stored is not None:
+            self.on_stored(job.destination)
+
+    def failed(self, job, error):
+        super().failed(job.source, error)
+
+
+def store(job):
+    if os.path.exists(job.destination):
+        return 'skipped'
+    copy_file(job.source, job.destination)
+    return 'copied'
@@ -0,0 +1,128 @@
+from psycopg import sql
+from psycopg.conninfo import conninfo_to_dict
+from psycopg_pool import ConnectionPool
+
+# Seconds to wait for the first connection to the source database
+CONNECT_TIMEOUT = 30
+
+_pools = {}
+
+SOURCE_COLUMNS = sql.SQL(
+    '"propertyTitle", latitude, longitude, location, rating, price, "roomType", images')
+# Primary key of the source table, the order of rows with the same key
+SOURCE_ID = 'id'
+
+
+def build_source_query(key_column=None, after=None, until=None):
+    """
+    Return the ``(query, params)`` reading ``public.hotels``. With a
+    ``key_column`` the key is selected as a ninth column and rows come
+    ordered by it, limited to ``after < key <= until`` for the bounds given.
+    A key other than ``SOURCE_ID`` need not be unique (e.g. an updated-at
+    timestamp): the id follows as a tenth column and orders the rows of
+    one key, and ``after`` can be a ``(key, id)`` position, see
+    ``row_position``.
+    """
+    if not key_column:
+        return sql.SQL('SELECT {} FROM public.hotels').format(SOURCE_COLUMNS), []
+
+    columns = [sql.Identifier(column) for column in _key_columns(key_column)]
+    query = sql.SQL('SELECT {}, {} FROM public.hotels').format(SOURCE_COLUMNS, sql.SQL(', ').join(columns))
+    where, params = _key_filter(key_column, after, until)
+    query += where + sql.SQL(' ORDER BY {}').format(sql.SQL(', ').join(columns))
+    return query, params
+
+
+def row_position(key_column, row):
+    """
+    ``(key, id)`` of a row of ``build_source_query``, the id ``None`` when
+    the key is the id. Rows after it are read with it as ``after``.
+    """
+    if key_column == SOURCE_ID:
+        return row[8], None
+    return row[8], row[9]
+
+
+def build_count_query(key_column=None, after=None):
+    """Return the query counting rows, distinct titles and image references."""
+    query = sql.SQL(
+        'SELECT count(*), count(DISTINCT "propertyTitle"), '
+        'coalesce(sum(cardinality(images)), 0) FROM public.hotels')
+    where, params = _key_filter(key_column, after)
+    return query + where, params
+
+
+def build_range_query(key_column, after=None):
+    """Return the query for the lowest and highest key after ``after``."""
+    key = sql.Identifier(key_column)
+    query = sql.SQL('SELECT min({}), max({}) FROM public.hotels').format(key, key)
+    where, params = _key_filter(key_column, after)
+    return query + where, params
+
+
+def split_key_range(lower, upper, parts):
+    """
+    Split the integer range ``lower < key <= upper`` into at most ``parts``
+    consecutive ``(after, until)`` ranges of about the same width.
+    """
+    step = max(-(-(upper - lower) // parts), 1)
+    return [(start, min(start + step, upper))
+            for start in range(lower, upper, step)]
+
+
+def _key_columns(key_column):
+    if key_column == SOURCE_ID:
+        return [key_column]
+    return [key_column, SOURCE_ID]
+
+
+def _key_filter(key_column, after=None, until=None):
+    conditions = []
+    params = []
+    if key_column and isinstance(after, tuple):
+        # A row position, the later rows of its key come first
+        conditions.append(sql.SQL('({}, {}) > (%s, %s)').format(
+            sql.Identifier(key_column), sql.Identifier(SOURCE_ID)))
+        params.extend(after)
+    elif key_column and after is not None:
+        conditions.append(sql.SQL('{} > %s').format(sql.Identifier(key_column)))
+        params.append(after)
+    if key_column and until is not None:
+        conditions.append(sql.SQL('{} <= %s').format(sql.Identifier(key_column)))
+        params.append(until)
+    if not conditions:
+        return sql.SQL(''), []
+    return sql.SQL(' WHERE ') + sql.SQL(' AND ').join(conditions), params
+
+
+def source_name(conninfo):
+    """Identify a source database by host, port and name, without credentials."""
+    info = conninfo_to_dict(conninfo)
+    return f"{info.get('host', 'localhost')}:{info.get('port', 5432)}/{info.get('dbname', '')}"
+
+
+def source_pool(conninfo):
+    """
+    The pool of connections to the source database of this process, so the
+    range and count queries and the import reuse one connection instead of
+    connecting for each. Raises ``psycopg.OperationalError`` (``PoolTimeout``)
+    when no connection can be made.
+    """
+    pool = _pools.get(conninfo)
+    if pool is None:
+        pool = ConnectionPool(
+            conninfo, min_size=1, max_size=1, open=False,
+            check=ConnectionPool.check_connection, name='polls-import-source')
+        try:
+            pool.open(wait=True, timeout=CONNECT_TIMEOUT)
+        except Exception:
+            pool.close()
+            raise
+        _pools[conninfo] = pool
+    return pool
+
+
+def close_source_pools():
+    while _pools:
+        _, pool = _pools.popitem()
+        pool.close()
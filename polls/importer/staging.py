@@ -0,0 +1,138 @@
+from django.db import connection
+
+from polls import cache, geo
+from polls.importer.bulk import BulkImporter
+from polls.models import HotelInformation, Location, Images
+
+STAGE_HOTELS = 'polls_import_stage_hotels'
+STAGE_IMAGES = 'polls_import_stage_images'
+
+
+class CopyImporter(BulkImporter):
+    """
+    Postgres only import backend. Each batch is streamed into temporary
+    staging tables with ``COPY ... FROM STDIN`` and merged into the polls
+    tables with a few set-based ``INSERT ... SELECT`` statements, so the
+    number of statements per batch does not depend on the number of rows.
+
+    Must run inside the batch transaction: the staging tables are
+    ``ON COMMIT DELETE ROWS`` and are emptied by every commit.
+    """
+
+    def import_rows(self, rows):
+        if not rows:
+            return []
+        images, copy_jobs, metadata = self.collect_images(rows)
+        with connection.cursor() as cursor:
+            self.create_staging_tables(cursor)
+            self.copy_rows(cursor, rows, images, metadata)
+            self.merge_locations(cursor)
+            self.merge_hotels(cursor)
+            self.merge_images(cursor)
+        # The merged hotels have no search vector yet
+        HotelInformation.objects.filter(
+            title__in={row[0] for row in rows}, searchVector__isnull=True,
+        ).update_search_vectors()
+        cache.invalidate_all_hotels()
+        return copy_jobs
+
+    def create_staging_tables(self, cursor):
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE IF NOT EXISTS {STAGE_HOTELS} ('
+            ' position integer, title text, location text,'
+            ' latitude double precision, longitude double precision, geohash text'
+            ') ON COMMIT DELETE ROWS')
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE IF NOT EXISTS {STAGE_IMAGES} ('
+            ' title text, image text, width integer, height integer,'
+            ' file_size bigint, format text, content_hash text'
+            ') ON COMMIT DELETE ROWS')
+
+    def copy_rows(self, cursor, rows, images, metadata):
+        # cursor.cursor is the psycopg cursor behind Django's wrapper
+        with cursor.cursor.copy(
+                f'COPY {STAGE_HOTELS} (position, title, location, latitude, longitude, geohash)'
+                f' FROM STDIN') as copy:
+            for position, row in enumerate(rows):
+                latitude, longitude = float(row[1]), float(row[2])
+                copy.write_row((position, row[0], row[3], latitude, longitude,
+                                geo.encode(latitude, longitude)))
+        with cursor.cursor.copy(
+                f'COPY {STAGE_IMAGES} (title, image, width, height, file_size, format, content_hash)'
+                f' FROM STDIN') as copy:
+            for title, image in images:
+                copy.write_row((title, image, *metadata[image]))
+
+    def merge_locations(self, cursor):
+        location = Columns(Location)
+        # In key order, like BulkImporter.resolve_locations, so concurrent
+        # imports do not deadlock on each other's new locations
+        cursor.execute(
+            f'INSERT INTO {location.table} ({location.name}, {location.type},'
+            f' {location.latitude}, {location.longitude}, {location.geohash}, {location.createDate})'
+            f' SELECT DISTINCT location, %s, latitude, longitude, geohash, now() FROM {STAGE_HOTELS}'
+            f' ORDER BY location, latitude, longitude'
+            f' ON CONFLICT ({location.name}, {location.latitude}, {location.longitude}) DO NOTHING',
+            [Location.CITY])
+        self.stats['locations_created'] += cursor.rowcount
+
+    def merge_hotels(self, cursor):
+        # Like the other backends, a new hotel gets the location of the first
+        # row it appears in, and an existing title is never created again.
+        hotel = Columns(HotelInformation)
+        location = Columns(Location)
+        through = Columns(HotelInformation.locations.through)
+        cursor.execute(
+            f'WITH new_hotels AS ('
+            f' INSERT INTO {hotel.table} ({hotel.title}, {hotel.createDate})'
+            f' SELECT title, now() FROM ('
+            f'  SELECT title, min(position) AS position FROM {STAGE_HOTELS} GROUP BY title'
+            f' ) AS stage'
+            f' WHERE NOT EXISTS (SELECT 1 FROM {hotel.table} WHERE {hotel.table}.{hotel.title} = stage.title)'
+            f' ORDER BY position'
+            f' RETURNING {hotel.id} AS id, {hotel.title} AS title'
+            f'), first_rows AS ('
+            f' SELECT DISTINCT ON (title) title, location, latitude, longitude'
+            f' FROM {STAGE_HOTELS} ORDER BY title, position'
+            f')'
+            f' INSERT INTO {through.table} ({through.hotelinformation}, {through.location})'
+            f' SELECT new_hotels.id, {location.table}.{location.id}'
+            f' FROM new_hotels'
+            f' JOIN first_rows ON first_rows.title = new_hotels.title'
+            f' JOIN {location.table} ON {location.table}.{location.name} = first_rows.location'
+            f'  AND {location.table}.{location.latitude} = first_rows.latitude'
+            f'  AND {location.table}.{location.longitude} = first_rows.longitude'
+            f' ON CONFLICT DO NOTHING')
+        # Every new hotel gets exactly one location link
+        self.stats['hotels_created'] += cursor.rowcount
+
+    def merge_images(self, cursor):
+        hotel = Columns(HotelInformation)
+        image = Columns(Images)
+        cursor.execute(
+            f'INSERT INTO {image.table} ({image.image}, {image.hotel}, {image.width}, {image.height},'
+            f' {image.fileSize}, {image.format}, {image.contentHash}, {image.createDate})'
+            f' SELECT stage.image, hotels.id, stage.width, stage.height,'
+            f' stage.file_size, stage.format, stage.content_hash, now()'
+            f' FROM (SELECT DISTINCT ON (title, image) * FROM {STAGE_IMAGES}) AS stage'
+            f' JOIN ('
+            f'  SELECT {hotel.title} AS title, min({hotel.id}) AS id FROM {hotel.table}'
+            f'  WHERE {hotel.title} IN (SELECT title FROM {STAGE_IMAGES}) GROUP BY {hotel.title}'
+            f' ) AS hotels ON hotels.title = stage.title'
+            f' ON CONFLICT ({image.hotel}, {image.image}) DO NOTHING')
+        self.stats['images_created'] += cursor.rowcount
+
+
+class Columns:
+    """
+    Quoted table and column names of a model for raw SQL, e.g.
+    ``Columns(Location).table`` and ``Columns(Location).latitude``.
+    """
+
+    def __init__(self, model):
+        self._model = model
+        self.table = connection.ops.quote_name(model._meta.db_table)
+
+    def __getattr__(self, attr):
+        field = self._model._meta.get_field(attr)
+        return connection.ops.quote_name(field.column)
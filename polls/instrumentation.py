@@ -0,0 +1,313 @@
+"""
+Query counts and database time of requests, command phases and tests.
+
+``QueryRecorder`` keeps every statement run while it is entered, with
+its time, through an ``execute_wrapper`` on the connections;
+``QueryStatistics`` only keeps totals, for blocks that run an unbounded
+number of them. On top of them ``QueryInstrumentationMiddleware`` reports
+each request, ``phase`` a step of a management command, both to the
+``polls.instrumentation`` logger
+(warnings past ``QUERY_LOG_MAX_QUERIES`` or ``QUERY_LOG_SLOW_MS``), and
+``QueryBudget`` fails a test whose block runs more queries than allowed, so
+an N+1 regression shows up in the test run instead of in production.
+"""
+import heapq
+import logging
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import FileResponse
+
+logger = logging.getLogger(__name__)
+
+Query = namedtuple('Query', ['sql', 'params', 'many', 'seconds'])
+
+# The QueryRecorders entered in the current context
+_recorders = ContextVar('polls_query_recorders', default=())
+
+
+def record(execute, sql, params, many, context):
+    """``execute_wrapper`` of every connection, timing the statements for the recorders in use."""
+    recorders = [recorder for recorder in _recorders.get()
+                 if recorder.using == context['connection'].alias]
+    if not recorders:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        query = Query(sql, params, many, time.perf_counter() - start)
+        for recorder in recorders:
+            recorder.add(query)
+
+
+def install(connection):
+    if record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record)
+
+
+@receiver(connection_created)
+def install_on_new_connection(sender, connection, **kwargs):
+    install(connection)
+
+
+class _Recording:
+    # Entering and leaving the recorders in use of the context
+    using = DEFAULT_DB_ALIAS
+
+    def __enter__(self):
+        install(connections[self.using])
+        _recorders.set((*_recorders.get(), self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _recorders.set(tuple(recorder for recorder in _recorders.get() if recorder is not self))
+
+
+class QueryRecorder(_Recording):
+    """
+    Records the statements run on the ``using`` connection while entered,
+    also from the threads ``sync_to_async`` runs the ORM on under ASGI:
+    connections are per thread, so the recorders in use are kept in a
+    context variable and every connection reports to them, see
+    ``install``. It can be entered again, the queries add up.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self.queries = []
+
+    def add(self, query):
+        self.queries.append(query)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def seconds(self):
+        return sum(query.seconds for query in self.queries)
+
+    def duplicates(self):
+        """``(sql, times)`` of the statements run more than once with the same parameters."""
+        counts = Counter((query.sql, repr(query.params)) for query in self.queries)
+        return [(sql, times) for (sql, _), times in counts.most_common() if times > 1]
+
+    @property
+    def duplicate_count(self):
+        # Repeats beyond the first run of each statement
+        return sum(times - 1 for _, times in self.duplicates())
+
+    def similar(self):
+        """
+        ``(sql, times)`` of the statements run more than once with any
+        parameters, the shape of an N+1: one query per row of a list.
+        """
+        counts = Counter(query.sql for query in self.queries)
+        return [(sql, times) for sql, times in counts.most_common() if times > 1]
+
+    def slowest(self, limit=5):
+        return sorted(self.queries, key=lambda query: query.seconds, reverse=True)[:limit]
+
+    def summary(self):
+        return (f'{self.count} queries in {self.seconds * 1000:.1f} ms, '
+                f'{self.duplicate_count} duplicates')
+
+    def report(self, limit=5):
+        """The summary, the most repeated and the slowest statements, for logs and test failures."""
+        lines = [self.summary()]
+        for sql, times in self.similar()[:limit]:
+            lines.append(f'  {times}x {sql}')
+        if self.queries:
+            lines.append('Slowest:')
+        for query in self.slowest(limit):
+            lines.append(f'  {query.seconds * 1000:.1f} ms {query.sql}')
+        return '\n'.join(lines)
+
+
+class QueryStatistics(_Recording):
+    """
+    Like ``QueryRecorder`` without keeping the statements: the count, the
+    time, how often each SQL text ran and the ``limit`` slowest statements,
+    without their parameters. Its memory does not grow with the number of
+    queries, so it suits a whole command run; repeats with the same
+    parameters are not told apart, there are no duplicates.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, limit=5):
+        self.using = using
+        self.limit = limit
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        # A min-heap of (seconds, sql), the fastest of the slowest on top
+        self._slowest = []
+
+    def add(self, query):
+        self.count += 1
+        self.seconds += query.seconds
+        self.statements[query.sql] += 1
+        if len(self._slowest) < self.limit:
+            heapq.heappush(self._slowest, (query.seconds, query.sql))
+        elif query.seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (query.seconds, query.sql))
+
+    def similar(self):
+        return [(sql, times) for sql, times in self.statements.most_common() if times > 1]
+
+    def slowest(self, limit=5):
+        return [Query(sql, None, False, seconds)
+                for seconds, sql in heapq.nlargest(limit, self._slowest)]
+
+    def summary(self):
+        return f'{self.count} queries in {self.seconds * 1000:.1f} ms'
+
+    def report(self, limit=5):
+        lines = [self.summary()]
+        for sql, times in self.similar()[:limit]:
+            lines.append(f'  {times}x {sql}')
+        if self.count:
+            lines.append('Slowest:')
+        for query in self.slowest(limit):
+            lines.append(f'  {query.seconds * 1000:.1f} ms {query.sql}')
+        return '\n'.join(lines)
+
+
+def log_queries(label, recorder, seconds, max_queries=None, slow_ms=None):
+    # Over a limit with the statements to look at, otherwise one line
+    if ((max_queries is not None and recorder.count > max_queries)
+            or (slow_ms is not None and recorder.seconds * 1000 > slow_ms)):
+        logger.warning('%s took %.1f ms: %s', label, seconds * 1000, recorder.report())
+    else:
+        logger.info('%s took %.1f ms: %s', label, seconds * 1000, recorder.summary())
+
+
+@contextmanager
+def phase(name, max_queries=None, slow_ms=None, using=DEFAULT_DB_ALIAS):
+    """
+    Record and log the queries of a step of a management command, as a
+    warning past ``max_queries`` or ``slow_ms`` of database time. Queries
+    of other threads and processes are not counted. It keeps
+    ``QueryStatistics``, not the statements, so a long step does not fill
+    the memory.
+    """
+    recorder = QueryStatistics(using)
+    start = time.perf_counter()
+    try:
+        with recorder:
+            yield recorder
+    finally:
+        log_queries(name, recorder, time.perf_counter() - start, max_queries, slow_ms)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records the queries of every request and logs them. With
+    ``QUERY_INSTRUMENTATION_HEADERS`` the response also gets them as
+    ``X-DB-Queries``, ``X-DB-Time`` (ms) and ``X-DB-Duplicates`` and as a
+    ``Server-Timing`` entry, which browser dev tools show. Streamed
+    responses other than files are logged once their body is sent,
+    without the headers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recorder:
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recorder:
+            response = await self.get_response(request)
+        return self.finish(request, response, recorder, start)
+
+    def finish(self, request, response, recorder, start):
+        def log():
+            log_queries(f'{request.method} {request.path}', recorder, time.perf_counter() - start,
+                        settings.QUERY_LOG_MAX_QUERIES, settings.QUERY_LOG_SLOW_MS)
+
+        # File bodies run no query, and wrapping them would lose sendfile()
+        if response.streaming and not isinstance(response, FileResponse):
+            response.streaming_content = self.record_stream(response, recorder, log)
+            return response
+        log()
+        if settings.QUERY_INSTRUMENTATION_HEADERS:
+            response.headers['X-DB-Queries'] = recorder.count
+            response.headers['X-DB-Time'] = f'{recorder.seconds * 1000:.1f}'
+            response.headers['X-DB-Duplicates'] = recorder.duplicate_count
+            timing = f'db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries"'
+            if 'Server-Timing' in response.headers:
+                timing = f"{response.headers['Server-Timing']}, {timing}"
+            response.headers['Server-Timing'] = timing
+        return response
+
+    @staticmethod
+    def record_stream(response, recorder, done):
+        # The body's queries run while the server iterates over it
+        body = response.streaming_content
+        if response.is_async:
+            async def content():
+                try:
+                    with recorder:
+                        async for chunk in body:
+                            yield chunk
+                finally:
+                    done()
+        else:
+            def content():
+                try:
+                    with recorder:
+                        yield from body
+                finally:
+                    done()
+        return content()
+
+
+class QueryBudget:
+    """
+    Fails ``test_case`` when the block runs more than ``queries`` statements
+    or repeats more than ``duplicates`` of them with the same parameters;
+    the failure lists the most repeated and the slowest ones::
+
+        with QueryBudget(self, queries=8):
+            self.client.get(url)
+    """
+
+    def __init__(self, test_case, queries, duplicates=0, using=DEFAULT_DB_ALIAS):
+        self.test_case = test_case
+        self.queries = queries
+        self.duplicates = duplicates
+        self.recorder = QueryRecorder(using)
+
+    def __enter__(self):
+        self.recorder.__enter__()
+        return self.recorder
+
+    def __exit__(self, exc_type, *exc_info):
+        self.recorder.__exit__(exc_type, *exc_info)
+        if exc_type is not None:
+            return
+        if self.recorder.count > self.queries or self.recorder.duplicate_count > self.duplicates:
+            self.test_case.fail(
+                f'Query budget of {self.queries} queries and {self.duplicates} duplicates '
+                f'exceeded: {self.recorder.report()}')
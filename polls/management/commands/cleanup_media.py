@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from polls.models import MediaCleanup
+
+
+class Command(BaseCommand):
+    help = 'Remove the queued image files of deleted images that are no longer referenced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of queued files handled per transaction')
+
+    def handle(self, *args, **kwargs):
+        pending = MediaCleanup.objects.count()
+        if not pending:
+            self.stdout.write('No files queued for cleanup.')
+            return
+        self.stdout.write(f'{pending} files queued for cleanup')
+        removed, kept = MediaCleanup.process(batch_size=kwargs['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully removed {removed} files, {kept} still referenced by other images.'))
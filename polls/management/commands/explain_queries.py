@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from polls.models import HotelInformation, Images, Location, Amenities
+
+
+class Command(BaseCommand):
+    help = 'Print the query plans of the hot lookups of the importers and the admin'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run the queries and show actual times and rows (PostgreSQL only)')
+
+    def handle(self, *args, **kwargs):
+        options = {}
+        if kwargs['analyze']:
+            if connection.vendor != 'postgresql':
+                self.stdout.write(self.style.ERROR('Error: --analyze needs a PostgreSQL database.'))
+                return
+            options = {'analyze': True, 'buffers': True}
+
+        # Real values where there are some, so the plans match the data
+        image = Images.objects.filter(hotel__isnull=False).select_related('hotel').first()
+        title = image.hotel.title if image else 'Hotel'
+        hotel_id = image.hotel_id if image else 1
+        image_name = image.image.name if image else 'images/image.jpg'
+        week_ago = timezone.now() - timedelta(days=7)
+
+        queries = [
+            ('Hotel by title (import_data)',
+             HotelInformation.objects.filter(title=title)),
+            ('Image of a hotel (get_or_create in import_data)',
+             Images.objects.filter(hotel_id=hotel_id, image=image_name)),
+            ('Hotels created in the last 7 days (admin filter)',
+             HotelInformation.objects.filter(createDate__gte=week_ago)),
+            ('Hotels updated in the last 7 days (admin filter)',
+             HotelInformation.objects.filter(updateDate__gte=week_ago)),
+            ('Images created in the last 7 days (admin filter)',
+             Images.objects.filter(createDate__gte=week_ago)),
+            ('Locations created in the last 7 days (admin filter)',
+             Location.objects.filter(createDate__gte=week_ago)),
+            ('Amenities updated in the last 7 days (admin filter)',
+             Amenities.objects.filter(updateDate__gte=week_ago)),
+        ]
+        for name, queryset in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**options))
+            self.stdout.write('')
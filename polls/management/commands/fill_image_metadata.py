@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from polls.metadata import InvalidImage, MetadataPool
+from polls.models import Images
+from polls.storage import image_storage
+
+
+class Command(BaseCommand):
+    help = 'Read the dimensions, size, format and content hash of the stored images that have none yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Number of processes reading the files, 0 reads them in this process')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of files read and updated at a time')
+
+    def handle(self, *args, **kwargs):
+        pending = (Images.objects.filter(contentHash__isnull=True)
+                   .exclude(image__isnull=True).exclude(image='')
+                   .order_by('image').values_list('image', flat=True).distinct())
+        updated = invalid = 0
+        last = ''
+        with MetadataPool(kwargs['workers']) as pool:
+            while True:
+                # By name, so rows of invalid files are not read again
+                names = list(pending.filter(image__gt=last)[:kwargs['batch_size']])
+                if not names:
+                    break
+                last = names[-1]
+                paths = {image_storage.path(name): name for name in names}
+                for path, result in pool.inspect(paths).items():
+                    if isinstance(result, InvalidImage):
+                        self.stdout.write(self.style.WARNING(f'{paths[path]}: {result}'))
+                        invalid += 1
+                        continue
+                    updated += Images.objects.filter(
+                        image=paths[path], contentHash__isnull=True).update(**result._asdict())
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully updated {updated} images, {invalid} files are missing or not valid images.'))
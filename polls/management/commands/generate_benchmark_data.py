@@ -0,0 +1,75 @@
+from decouple import config
+from django.core.management.base import BaseCommand
+from polls.benchmarks import SyntheticData, clear_data, populate, write_images, write_source
+from polls.models import HotelInformation
+
+
+class Command(BaseCommand):
+    help = ('Generate a repeatable synthetic data set for run_benchmarks: a scrapy source table, '
+            'dummy image files and/or the polls tables')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotels', type=int, default=1000,
+                            help='Number of hotels to generate')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the generator, the same seed always gives the same data')
+        parser.add_argument('--distinct-images', type=int, default=200,
+                            help='Number of image files the hotels pick their images from')
+        parser.add_argument('--image-size', default='1600x1200',
+                            help='WIDTHxHEIGHT of the image files')
+        parser.add_argument('--images-dir', default=config('IMPORT_IMAGES_DIR', default=None),
+                            help='Directory the image files are written to (IMPORT_IMAGES_DIR)')
+        parser.add_argument('--source-dsn', default=config('IMPORT_SOURCE_DSN', default=None),
+                            help='Connection string of a scratch PostgreSQL database that gets the '
+                                 'scrapy public.hotels table (IMPORT_SOURCE_DSN)')
+        parser.add_argument('--populate', action='store_true',
+                            help='Also insert the hotels straight into the polls tables, without import_data')
+        parser.add_argument('--replace', action='store_true',
+                            help='Empty the source table and, with --populate, delete the existing '
+                                 'hotels, images and locations first')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['hotels'] < 1:
+            self.stdout.write(self.style.ERROR('Error: --hotels must be a positive number.'))
+            return
+        try:
+            width, height = map(int, kwargs['image_size'].lower().split('x'))
+        except ValueError:
+            self.stdout.write(self.style.ERROR('Error: --image-size must look like 1600x1200.'))
+            return
+        if not (kwargs['images_dir'] or kwargs['source_dsn'] or kwargs['populate']):
+            self.stdout.write(self.style.ERROR(
+                'Error: nothing to generate, give --images-dir, --source-dsn or --populate.'))
+            return
+        if kwargs['populate'] and HotelInformation.objects.exists() and not kwargs['replace']:
+            self.stdout.write(self.style.ERROR(
+                'Error: the database already has hotels, pass --replace to delete them.'))
+            return
+
+        data = SyntheticData(kwargs['hotels'], kwargs['seed'], kwargs['distinct_images'])
+        if kwargs['images_dir']:
+            written = write_images(kwargs['images_dir'], data.image_names, (width, height), kwargs['seed'])
+            self.stdout.write(f"{written} image files written to {kwargs['images_dir']}, "
+                              f"{len(data.image_names) - written} already there")
+
+        if kwargs['source_dsn']:
+            rows = write_source(kwargs['source_dsn'], data.source_rows(), kwargs['replace'])
+            if rows is None:
+                self.stdout.write(self.style.ERROR(
+                    'Error: the source table public.hotels already has rows, pass --replace to empty it.'))
+                return
+            self.stdout.write(f'{rows} rows written to the source table public.hotels')
+
+        if kwargs['populate']:
+            if not kwargs['images_dir']:
+                self.stdout.write(self.style.WARNING(
+                    'No --images-dir, the hotels are created without images.'))
+            if kwargs['replace']:
+                clear_data()
+            counts = populate(data, kwargs['images_dir'] or '')
+            self.stdout.write(
+                f"{counts['hotels']} hotels, {counts['locations']} locations, "
+                f"{counts['amenities']} amenities and {counts['images']} images created")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully generated {kwargs['hotels']} hotels with seed {kwargs['seed']}."))
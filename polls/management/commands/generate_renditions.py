@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from polls.models import Images
+from polls.renditions import RenditionPool
+from polls.storage import image_storage
+
+
+class Command(BaseCommand):
+    help = 'Make the missing WebP renditions of the stored images, e.g. after adding one to IMAGE_RENDITIONS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_RENDITION_WORKERS,
+                            help='Number of processes making renditions, 0 makes them in this process')
+
+    def handle(self, *args, **kwargs):
+        names = (Images.objects.exclude(image__isnull=True).exclude(image='')
+                 .order_by('image').values_list('image', flat=True).distinct())
+        with RenditionPool(kwargs['workers']) as pool:
+            for name in names.iterator():
+                pool.submit(image_storage.path(name))
+        for path, error in pool.errors:
+            self.stdout.write(self.style.ERROR(
+                f'Error making the renditions of {path}: {error}'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully made {pool.stats['renditions']} renditions of {pool.stats['rendered']} files, "
+            f"{pool.stats['skipped']} files were complete, {pool.stats['failed']} failed."))
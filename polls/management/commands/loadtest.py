@@ -0,0 +1,94 @@
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ['/polls/api/hotels/', '/polls/api/sync/hotels/']
+
+
+class Command(BaseCommand):
+    help = 'Load a running server with concurrent GETs and report req/s and latency per path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS,
+                            help='Paths to request, one run each (default: async and sync hotel list)')
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Base URL of the server')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Number of requests in flight at once')
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Number of requests per path')
+        parser.add_argument('--warmup', type=int, default=100,
+                            help='Requests sent before measuring, e.g. to fill the caches')
+
+    def handle(self, *args, **kwargs):
+        url = urlsplit(kwargs['url'])
+        if url.scheme not in ('http', 'https') or not url.netloc:
+            raise CommandError(f"Invalid URL: {kwargs['url']}")
+        if kwargs['concurrency'] < 1 or kwargs['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1.')
+
+        for path in kwargs['paths']:
+            self.run(url, path, kwargs['concurrency'], kwargs['warmup'])
+            latencies, errors, elapsed = self.run(url, path, kwargs['concurrency'], kwargs['requests'])
+            self.stdout.write(self.style.MIGRATE_HEADING(path))
+            if not latencies:
+                self.stdout.write(self.style.ERROR(f'All {errors} requests failed.'))
+                continue
+            latencies.sort()
+            self.stdout.write(
+                f'{len(latencies) / elapsed:.1f} req/s, '
+                f'p50 {percentile(latencies, 50):.1f} ms, '
+                f'p99 {percentile(latencies, 99):.1f} ms, '
+                f'mean {statistics.mean(latencies):.1f} ms, '
+                f'{errors} errors')
+
+    def run(self, url, path, concurrency, count):
+        """Send ``count`` GETs of ``path`` from ``concurrency`` threads, each on its own keep-alive connection."""
+        connection_class = (http.client.HTTPSConnection if url.scheme == 'https'
+                            else http.client.HTTPConnection)
+        remaining = iter(range(count))
+        lock = threading.Lock()
+        latencies = []
+        errors = 0
+
+        def worker():
+            nonlocal errors
+            connection = connection_class(url.netloc, timeout=30)
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                start = time.perf_counter()
+                try:
+                    connection.request('GET', url.path.rstrip('/') + path)
+                    response = connection.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    ok = False
+                latency = (time.perf_counter() - start) * 1000
+                with lock:
+                    if ok:
+                        latencies.append(latency)
+                    else:
+                        errors += 1
+            connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(min(concurrency, count))]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors, time.perf_counter() - start
+
+
+def percentile(values, percent):
+    """``percent``-th percentile of sorted ``values``, nearest rank."""
+    index = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[index]
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from polls.models import HotelInformation
+
+
+class Command(BaseCommand):
+    help = 'Recompute the full text search vectors of the hotels in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of hotels updated per statement')
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Only index hotels that have no search vector yet')
+
+    def handle(self, *args, **kwargs):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.ERROR(
+                'Error: full text search needs a PostgreSQL database.'))
+            return
+
+        queryset = HotelInformation.objects.order_by('pk')
+        if kwargs['missing_only']:
+            queryset = queryset.filter(searchVector__isnull=True)
+
+        # Walk the primary keys, so every batch is a short UPDATE
+        last_pk = 0
+        updated = 0
+        while True:
+            pks = list(queryset.filter(pk__gt=last_pk).values_list(
+                'pk', flat=True)[:kwargs['batch_size']])
+            if not pks:
+                break
+            updated += HotelInformation.objects.filter(pk__in=pks).update_search_vectors()
+            last_pk = pks[-1]
+            self.stdout.write(f'{updated} hotels indexed')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully rebuilt the search index of {updated} hotels.'))
@@ -0,0 +1,168 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import django
+from decouple import config
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from polls.benchmarks import SEARCH_TERMS, admin_benchmarks, import_benchmark, search_benchmarks
+from polls.importer.source import close_source_pools
+from polls.models import Amenities, HotelInformation, Images, Location
+
+BENCHMARKS = ['admin', 'search', 'import']
+# Changes of the median time beyond this share are reported by --compare
+THRESHOLD = 0.10
+
+
+class Command(BaseCommand):
+    help = ('Time the admin pages, the search and import_data on the current data (see '
+            'generate_benchmark_data) and write the results as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', dest='benchmarks', choices=BENCHMARKS,
+                            help='Benchmark to run, can be repeated; all by default, import needs --source-dsn')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed runs of every page and search, after one warm-up run')
+        parser.add_argument('--search-term', action='append', dest='search_terms',
+                            help=f'Term of the search benchmark, can be repeated (default: {", ".join(SEARCH_TERMS)})')
+        parser.add_argument('--import-backend', action='append', dest='import_backends',
+                            choices=['row', 'bulk', 'copy'],
+                            help='import_data backend to time, can be repeated (default: bulk)')
+        parser.add_argument('--reset-import', action='store_true',
+                            help='Delete the hotels, images and locations before every import run, '
+                                 'so all rows are new. Only use it on a benchmark database.')
+        parser.add_argument('--username', default=config('IMPORT_ADMIN_USERNAME', default=None),
+                            help='Admin username of import_data (IMPORT_ADMIN_USERNAME)')
+        parser.add_argument('--password', default=config('IMPORT_ADMIN_PASSWORD', default=None),
+                            help='Admin password of import_data (IMPORT_ADMIN_PASSWORD)')
+        parser.add_argument('--source-dsn', default=config('IMPORT_SOURCE_DSN', default=None),
+                            help='Connection string of the generated source database (IMPORT_SOURCE_DSN)')
+        parser.add_argument('--images-dir', default=config('IMPORT_IMAGES_DIR', default=None),
+                            help='Directory of the generated image files (IMPORT_IMAGES_DIR)')
+        parser.add_argument('--label', default='',
+                            help='Free text stored with the results, e.g. the change being measured')
+        parser.add_argument('--output',
+                            help='File the JSON results are written to, printed when not given')
+        parser.add_argument('--compare',
+                            help='JSON results of an earlier run to compare this run with')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['repeat'] < 1:
+            self.stdout.write(self.style.ERROR('Error: --repeat must be a positive number.'))
+            return
+        baseline = None
+        if kwargs['compare']:
+            try:
+                with open(kwargs['compare']) as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as e:
+                self.stdout.write(self.style.ERROR(f"Error reading {kwargs['compare']}: {e}"))
+                return
+
+        benchmarks = kwargs['benchmarks'] or BENCHMARKS
+        report = {
+            'label': kwargs['label'],
+            'started': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'data': data_counts(),
+            'repeat': kwargs['repeat'],
+            'results': {},
+        }
+        results = report['results']
+        try:
+            if 'admin' in benchmarks:
+                self.stderr.write('Timing the admin pages')
+                results.update(admin_benchmarks(kwargs['repeat']))
+            if 'search' in benchmarks:
+                self.stderr.write('Timing the search')
+                results.update(search_benchmarks(kwargs['search_terms'] or SEARCH_TERMS, kwargs['repeat']))
+            # Last, it changes the data the other benchmarks read
+            if 'import' in benchmarks:
+                results.update(self.import_benchmarks(**kwargs))
+        except CommandError as e:
+            self.stdout.write(self.style.ERROR(f'Error: {e}'))
+            return
+        finally:
+            close_source_pools()
+
+        output = json.dumps(report, indent=2)
+        if kwargs['output']:
+            with open(kwargs['output'], 'w') as file:
+                file.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(
+                f"Successfully wrote {len(results)} results to {kwargs['output']}."))
+        else:
+            self.stdout.write(output)
+        if baseline is not None:
+            self.compare(baseline, report)
+
+    def import_benchmarks(self, **kwargs):
+        missing = [option for option in ('username', 'password', 'source_dsn', 'images_dir')
+                   if not kwargs[option]]
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f"Skipping the import benchmark, missing: {', '.join(missing)}."))
+            return {}
+        options = {option: kwargs[option] for option in ('username', 'password', 'source_dsn', 'images_dir')}
+        results = {}
+        for backend in kwargs['import_backends'] or ['bulk']:
+            if backend == 'copy' and connection.vendor != 'postgresql':
+                self.stdout.write(self.style.WARNING(
+                    'Skipping the copy backend, it needs a PostgreSQL database.'))
+                continue
+            self.stderr.write(f'Timing import_data --backend {backend}')
+            results[f'import.{backend}'] = import_benchmark(backend, options, kwargs['reset_import'])
+        return results
+
+    def compare(self, baseline, report):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Compared with {baseline.get('label') or baseline.get('commit') or 'the baseline'} "
+            f"of {baseline.get('started')}"))
+        if baseline.get('data') != report['data']:
+            self.stdout.write(self.style.WARNING(
+                f"The data differs: {baseline.get('data')} then, {report['data']} now."))
+        previous = baseline.get('results', {})
+        for name, result in report['results'].items():
+            if name not in previous:
+                continue
+            before, after = timing(previous[name]), timing(result)
+            change = (after - before) / before if before else 0
+            line = (f'{name}: {before:.2f} -> {after:.2f} ms ({change:+.1%}), '
+                    f"queries {previous[name].get('queries')} -> {result.get('queries')}")
+            if change > THRESHOLD or result.get('queries', 0) > previous[name].get('queries', 0):
+                self.stdout.write(self.style.ERROR(line))
+            elif change < -THRESHOLD:
+                self.stdout.write(self.style.SUCCESS(line))
+            else:
+                self.stdout.write(line)
+
+
+def timing(result):
+    # Median of the repeated runs, the single run of an import
+    if 'ms' in result:
+        return result['ms']['median']
+    return result['seconds'] * 1000
+
+
+def data_counts():
+    return {
+        'hotels': HotelInformation.objects.count(),
+        'locations': Location.objects.count(),
+        'amenities': Amenities.objects.count(),
+        'images': Images.objects.count(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,119 @@
+"""
+Serving of the stored image files.
+
+Access is checked in Django (see ``views.media_file``), the bytes are sent
+by the front-end server when there is one: ``X-Accel-Redirect`` for nginx,
+``X-Sendfile`` for Apache (mod_xsendfile) or lighttpd, see
+``settings.MEDIA_SERVER``. Otherwise a ``FileResponse`` sends them, which
+WSGI servers such as gunicorn pass to ``sendfile()``. Either way responses
+carry validators and long-lived cache headers: stored names never change
+content (see ``polls.storage``).
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """
+    Reads ``length`` bytes of ``file`` from ``start``. It has no
+    ``fileno()``, so the server streams it instead of sending the whole
+    file; only partial responses use it.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) of a ``Range: bytes=`` header for a file of
+    ``size`` bytes. None when the whole file is to be sent (no header, an
+    invalid one such as ``bytes=5-2``, or one this does not handle such as
+    several ranges), ``ValueError`` when the range is not satisfiable.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first and last and int(first) > int(last):
+        # An invalid range, which RFC 9110 says to ignore
+        return None
+    if not first:
+        # The last N bytes, none of an empty file
+        if not int(last) or not size:
+            raise ValueError
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if start >= size:
+        raise ValueError
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def serve(request, storage, name):
+    """Response sending the stored file ``name``, the caller has checked the access."""
+    path = storage.path(name)
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if settings.MEDIA_SERVER == 'nginx':
+            response = HttpResponse(content_type=content_type)
+            response.headers['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_PREFIX + name)
+        elif settings.MEDIA_SERVER in ('apache', 'lighttpd'):
+            response = HttpResponse(content_type=content_type)
+            response.headers['X-Sendfile'] = path
+        else:
+            response = file_response(request, path, stat.st_size, etag, content_type)
+    if response.status_code in (200, 206, 304):
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE, immutable=True)
+    return response
+
+
+def file_response(request, path, size, etag, content_type):
+    # A Range is only honoured while the file is still the one If-Range names
+    header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        header = None
+    try:
+        requested = parse_range(header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if requested is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = requested
+        response = FileResponse(
+            RangeFile(open(path, 'rb'), start, end - start + 1),
+            status=206, content_type=content_type)
+        response.headers['Content-Length'] = end - start + 1
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
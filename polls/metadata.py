@@ -0,0 +1,111 @@
+"""
+Metadata and validation of image files, without decoding them.
+
+Pillow only parses the header on ``Image.open``, which gives the format and
+the dimensions. The content hash needs the bytes, but no pixel is decoded,
+and truncated files are caught with a look at the format's end marker
+(``verify()`` checks the chunks of PNGs). ``MetadataPool`` runs this on
+worker processes during imports, so bad files never reach the database.
+"""
+import hashlib
+import os
+import struct
+from collections import namedtuple
+
+from PIL import Image
+
+from polls.pools import WorkerPool
+
+CHUNK_SIZE = 1024 * 1024
+# Formats accepted for Images, as named by Pillow
+FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+# Bytes searched for the end marker, encoders may pad the file after it
+TAIL_SIZE = 1024
+
+ImageMetadata = namedtuple(
+    'ImageMetadata', ['width', 'height', 'fileSize', 'format', 'contentHash'])
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def read_metadata(file):
+    """``ImageMetadata`` of an open binary file, ``InvalidImage`` when it is not a complete image."""
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    if not size:
+        raise InvalidImage('The file is empty.')
+    file.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image_format = image.format
+            width, height = image.size
+            if image_format not in FORMATS:
+                raise InvalidImage(f'Unsupported image format {image_format}.')
+            image.verify()
+    except InvalidImage:
+        raise
+    except Exception as e:
+        # Not an image, a broken header or chunk, or a decompression bomb
+        raise InvalidImage(f'Not a valid image: {e}') from e
+    if not width or not height:
+        raise InvalidImage('The image has no pixels.')
+    if is_truncated(file, image_format, size):
+        raise InvalidImage(f'Truncated {image_format} file.')
+    file.seek(0)
+    return ImageMetadata(width, height, size, image_format, digest.hexdigest())
+
+
+def is_truncated(file, image_format, size):
+    file.seek(max(size - TAIL_SIZE, 0))
+    tail = file.read()
+    if image_format == 'JPEG':
+        return b'\xff\xd9' not in tail
+    if image_format == 'GIF':
+        return not tail.rstrip(b'\0').endswith(b'\x3b')
+    if image_format == 'WEBP':
+        # The RIFF header holds the size of the rest of the file
+        file.seek(4)
+        return struct.unpack('<I', file.read(4))[0] + 8 > size
+    # PNG chunks were checked by verify()
+    return False
+
+
+def path_metadata(path):
+    with open(path, 'rb') as file:
+        return read_metadata(file)
+
+
+def inspect(path):
+    # Worker entry point: errors are returned, not raised, so one bad file
+    # does not cost the whole batch
+    try:
+        return path_metadata(path)
+    except (InvalidImage, OSError) as e:
+        return InvalidImage(str(e))
+
+
+class MetadataPool(WorkerPool):
+    """
+    Reads the metadata of image files on a pool of processes, see
+    ``WorkerPool``. ``inspect`` returns ``{path: ImageMetadata or
+    InvalidImage}``. With ``workers=0`` files are read inline.
+    """
+
+    processes = True
+
+    def __init__(self, workers=2):
+        super().__init__(workers)
+
+    def inspect(self, paths):
+        paths = list(dict.fromkeys(paths))
+        if self._executor is None or len(paths) < 2:
+            return {path: inspect(path) for path in paths}
+        chunksize = max(len(paths) // (self.workers * 4), 1)
+        return dict(zip(paths, self._executor.map(inspect, paths, chunksize=chunksize)))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0011_alter_amenities_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=500, unique=True)),
+                ('keyColumn', models.CharField(max_length=200)),
+                ('lastKey', models.CharField(blank=True, max_length=200, null=True)),
+                ('createDate', models.DateTimeField(auto_now_add=True)),
+                ('updateDate', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
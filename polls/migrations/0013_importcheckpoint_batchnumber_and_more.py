@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0012_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='batchNumber',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='resumeKey',
+            field=models.CharField(blank=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='rowsProcessed',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('completed', 'Completed')], default='completed', max_length=10),
+        ),
+    ]
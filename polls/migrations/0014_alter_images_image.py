@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:47
+
+import polls.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0013_importcheckpoint_batchnumber_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='images',
+            name='image',
+            field=models.ImageField(null=True, storage=polls.storage.ContentAddressedStorage(), upload_to='images/'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:49
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0014_alter_images_image'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='hotelinformation',
+            name='searchVector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='hotelinformation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['searchVector'], name='polls_hotel_search_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='hotelinformation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='polls_hotel_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
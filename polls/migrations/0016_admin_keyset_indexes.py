@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0015_hotelinformation_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hotelinformation',
+            index=models.Index(fields=['createDate', 'id'], name='polls_hotel_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='images',
+            index=models.Index(fields=['createDate', 'id'], name='polls_images_created_id'),
+        ),
+    ]
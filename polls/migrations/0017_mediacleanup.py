@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0016_admin_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaCleanup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('createDate', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:56
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_images(apps, schema_editor):
+    # Keep the oldest row of every (hotel, image) pair, they all point to
+    # the same file so no file has to be removed
+    Images = apps.get_model('polls', 'Images')
+    duplicates = (Images.objects.filter(hotel__isnull=False).values('hotel', 'image')
+                  .annotate(first=Min('pk'), rows=Count('pk')).filter(rows__gt=1))
+    for duplicate in duplicates.iterator():
+        Images.objects.filter(
+            hotel=duplicate['hotel'], image=duplicate['image'],
+        ).exclude(pk=duplicate['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0017_mediacleanup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='amenities',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['createDate'], name='polls_amenity_created_brin'),
+        ),
+        migrations.AddIndex(
+            model_name='amenities',
+            index=models.Index(fields=['updateDate'], name='polls_amenity_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='hotelinformation',
+            index=models.Index(fields=['updateDate'], name='polls_hotel_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='hotelinformation',
+            index=models.Index(fields=['title'], name='polls_hotel_title'),
+        ),
+        migrations.AddIndex(
+            model_name='images',
+            index=models.Index(fields=['updateDate'], name='polls_images_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['createDate'], name='polls_location_created_brin'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['updateDate'], name='polls_location_updated'),
+        ),
+        migrations.RunPython(remove_duplicate_images, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='images',
+            constraint=models.UniqueConstraint(fields=('hotel', 'image'), name='polls_images_unique_hotel_image'),
+        ),
+    ]
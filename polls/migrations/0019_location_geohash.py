@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:57
+
+from django.db import migrations, models
+
+from polls import geo
+
+
+def fill_geohashes(apps, schema_editor):
+    Location = apps.get_model('polls', 'Location')
+    batch = []
+    for location in Location.objects.only('pk', 'latitude', 'longitude').iterator(chunk_size=2000):
+        location.geohash = geo.encode(location.latitude, location.longitude)
+        batch.append(location)
+        if len(batch) == 2000:
+            Location.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    Location.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0018_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(fill_geohashes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['geohash'], name='polls_location_geohash', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
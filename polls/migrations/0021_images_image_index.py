@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0020_images_metadata'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='images',
+            index=models.Index(fields=['image'], name='polls_images_image', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
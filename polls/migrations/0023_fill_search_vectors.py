@@ -0,0 +1,46 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# polls.models.SEARCH_CONFIG when the column was added
+SEARCH_CONFIG = 'english'
+
+
+def fill_search_vectors(apps, schema_editor):
+    # 0015 added the column empty; the same document as
+    # HotelInformationQuerySet.update_search_vectors, a batch of hotels per UPDATE
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    HotelInformation = apps.get_model('polls', 'HotelInformation')
+    Location = apps.get_model('polls', 'Location')
+    Amenities = apps.get_model('polls', 'Amenities')
+    location_names = Location.objects.filter(hotels=OuterRef('pk')).values(
+        'hotels').annotate(names=StringAgg('name', ' ')).values('names')
+    amenity_names = Amenities.objects.filter(hotels=OuterRef('pk')).values(
+        'hotels').annotate(names=StringAgg('name', ' ')).values('names')
+    vector = (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(location_names), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(amenity_names), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+    missing = HotelInformation.objects.filter(searchVector__isnull=True).order_by('pk')
+    last_pk = 0
+    while True:
+        pks = list(missing.filter(pk__gt=last_pk).values_list('pk', flat=True)[:5000])
+        if not pks:
+            break
+        HotelInformation.objects.filter(pk__in=pks).update(searchVector=vector)
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0022_importcheckpoint_position_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,22 @@
-from django.db import models
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import BrinIndex, GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, SearchVectorField, TrigramSimilarity)
+import threading
+from collections import Counter
+
+from django.db import connection, connections, models, transaction
+from django.db.models import F, Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
 import os
 from django.conf import settings
+from polls import cache, geo, renditions
+from polls.metadata import InvalidImage, read_metadata
+from polls.storage import image_storage, lock_files
+
+# Text search configuration used for both the stored vectors and the queries
+SEARCH_CONFIG = 'english'
 
 
 class Amenities(models.Model):
@@ -9,6 +24,14 @@ class Amenities(models.Model):
     createDate = models.DateTimeField(auto_now_add=True)
     updateDate = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Admin date filters. Rows are only appended, so createDate
+            # follows the physical order and a tiny BRIN index is enough.
+            BrinIndex(fields=['createDate'], name='polls_amenity_created_brin'),
+            models.Index(fields=['updateDate'], name='polls_amenity_updated'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -18,6 +41,21 @@ class Amenities(models.Model):
         super().save(*args, **kwargs)
 
 
+class LocationQuerySet(models.QuerySet):
+    def within_bbox(self, south, west, north, east):
+        """Locations inside the box (degrees), through the geohash index."""
+        return self.filter(geo.bbox_filter(south, west, north, east))
+
+    def within_radius(self, latitude, longitude, km):
+        """
+        Locations within ``km`` of the point, annotated with their
+        ``distance`` in km. The geohash cells around the circle narrow the
+        candidates before the exact distance test.
+        """
+        return self.within_bbox(*geo.radius_bbox(latitude, longitude, km)).annotate(
+            distance=geo.distance_km(latitude, longitude)).filter(distance__lte=km)
+
+
 class Location(models.Model):
     CITY = 'city'
     STATE = 'state'
@@ -37,11 +75,23 @@ class Location(models.Model):
     )
     latitude = models.FloatField()
     longitude = models.FloatField()
+    # Set from latitude/longitude on save and by the importers, see polls.geo
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
     createDate = models.DateTimeField(auto_now_add=True)
     updateDate = models.DateTimeField(null=True, blank=True)
 
+    objects = LocationQuerySet.as_manager()
+
     class Meta:
         unique_together = ('name', 'latitude', 'longitude')
+        indexes = [
+            # Prefix (LIKE 'abc%') scans of the spatial queries
+            models.Index(fields=['geohash'], name='polls_location_geohash',
+                         opclasses=['varchar_pattern_ops']),
+            # Admin date filters, see Amenities
+            BrinIndex(fields=['createDate'], name='polls_location_created_brin'),
+            models.Index(fields=['updateDate'], name='polls_location_updated'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.get_type_display()})"
@@ -49,9 +99,111 @@ class Location(models.Model):
     def save(self, *args, **kwargs):
         if self.pk is not None:
             self.updateDate = timezone.now()
+        self.geohash = geo.encode(float(self.latitude), float(self.longitude))
         super().save(*args, **kwargs)
 
 
+class HotelInformationQuerySet(models.QuerySet):
+    def search(self, term):
+        """
+        Full text search over title, description, location and amenity
+        names, falling back to trigram similarity on the title for partial
+        words and typos. Results are annotated with ``rank``. PostgreSQL only.
+        """
+        query = SearchQuery(term, search_type='websearch', config=SEARCH_CONFIG)
+        return self.annotate(
+            rank=SearchRank(F('searchVector'), query) + TrigramSimilarity('title', term),
+        ).filter(Q(searchVector=query) | Q(title__trigram_similar=term))
+
+    def update_search_vectors(self):
+        """Recompute ``searchVector`` of these hotels with one UPDATE."""
+        if connection.vendor != 'postgresql':
+            return 0
+        location_names = Location.objects.filter(hotels=OuterRef('pk')).values(
+            'hotels').annotate(names=StringAgg('name', ' ')).values('names')
+        amenity_names = Amenities.objects.filter(hotels=OuterRef('pk')).values(
+            'hotels').annotate(names=StringAgg('name', ' ')).values('names')
+        return self.update(searchVector=(
+            SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(Subquery(location_names), weight='B', config=SEARCH_CONFIG)
+            + SearchVector(Subquery(amenity_names), weight='B', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+        ))
+
+    def touch(self):
+        """
+        Set ``updateDate`` of these hotels to now, for changes that leave
+        every date in ``with_last_change`` as it was: links to locations and
+        amenities added or removed, images deleted.
+        """
+        return self.update(updateDate=timezone.now())
+
+    def with_last_change(self):
+        """
+        Annotate ``lastChange``, the latest creation or update of each
+        hotel and of its locations, amenities and images, the
+        ``Last-Modified`` of its API responses.
+        """
+        changed = Coalesce('updateDate', 'createDate')
+
+        def latest(queryset, lookup):
+            return Coalesce(Subquery(queryset.filter(**{lookup: OuterRef('pk')}).values(
+                lookup).annotate(latest=Max(Coalesce('updateDate', 'createDate'))).values('latest')),
+                changed)
+
+        # Greatest() is NULL on SQLite when one of its values is, hence the Coalesce
+        return self.annotate(lastChange=Greatest(
+            changed,
+            latest(Location.objects.all(), 'hotels'),
+            latest(Amenities.objects.all(), 'hotels'),
+            latest(Images.objects.all(), 'hotel'),
+        ))
+
+    def near(self, latitude, longitude, km):
+        """
+        Hotels with a location within ``km`` of the point, annotated with
+        the ``distance`` in km of their nearest one, nearest first.
+        """
+        lookup = 'locations__'
+        return self.filter(
+            geo.bbox_filter(*geo.radius_bbox(latitude, longitude, km), prefix=lookup),
+        ).annotate(
+            distance=Min(geo.distance_km(latitude, longitude, prefix=lookup)),
+        ).filter(distance__lte=km).order_by('distance', 'pk')
+
+    def within_bbox(self, south, west, north, east):
+        """Hotels with a location inside the box (degrees)."""
+        return self.filter(locations__in=Location.objects.within_bbox(
+            south, west, north, east).values('pk')).distinct()
+
+    def delete_with_media(self, batch_size=1000):
+        """
+        Delete these hotels and their images with set-based SQL in one
+        transaction, and queue the image files for ``MediaCleanup``.
+
+        The hotels are deleted without Django's collector, which would load
+        every one of them to send its ``post_delete`` (a cache invalidation
+        per hotel); ``invalidate_all_hotels`` covers them all.
+        """
+        # Taken first, as the filter of the queryset may follow the images
+        # and links deleted below
+        pks = list(self.values_list('pk', flat=True))
+        deleted = Counter()
+        with transaction.atomic():
+            cache.invalidate_all_hotels()
+            for start in range(0, len(pks), batch_size):
+                batch = pks[start:start + batch_size]
+                images = Images.objects.filter(hotel__in=batch)
+                MediaCleanup.queue(images.values_list('image', flat=True).distinct())
+                for related in (images,
+                                self.model.locations.through.objects.filter(hotelinformation__in=batch),
+                                self.model.amenities.through.objects.filter(hotelinformation__in=batch)):
+                    deleted.update(related.delete()[1])
+                hotels = self.model.objects.filter(pk__in=batch)
+                deleted[self.model._meta.label] += hotels._raw_delete(hotels.db)
+        return sum(deleted.values()), dict(deleted)
+
+
 class HotelInformation(models.Model):
     title = models.CharField(max_length=500)
     description = models.TextField(max_length=50000, null=True, blank=True)
@@ -60,6 +212,23 @@ class HotelInformation(models.Model):
         Amenities, related_name='hotels', blank=True)
     createDate = models.DateTimeField(auto_now_add=True)
     updateDate = models.DateTimeField(null=True, blank=True)
+    # Maintained by polls.signals and the importers, see update_search_vectors()
+    searchVector = SearchVectorField(null=True, editable=False)
+
+    objects = HotelInformationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['searchVector'], name='polls_hotel_search_gin'),
+            GinIndex(fields=['title'], name='polls_hotel_title_trgm',
+                     opclasses=['gin_trgm_ops']),
+            # Keyset pagination of the admin, see polls.pagination. Also
+            # serves the createDate filter.
+            models.Index(fields=['createDate', 'id'], name='polls_hotel_created_id'),
+            models.Index(fields=['updateDate'], name='polls_hotel_updated'),
+            # Exact title lookups of the importers
+            models.Index(fields=['title'], name='polls_hotel_title'),
+        ]
 
     def __str__(self):
         return self.title
@@ -70,30 +239,63 @@ class HotelInformation(models.Model):
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        # Delete associated images from local storage
-        for image in self.images.all():
-            if image.image:
-                image_path = os.path.join(
-                    settings.MEDIA_ROOT, str(image.image))
-                if os.path.isfile(image_path):
-                    try:
-                        os.remove(image_path)
-                    except Exception as e:
-                        print(f"Error deleting image {image_path}: {str(e)}")
-        super().delete(*args, **kwargs)
+        # The image files are removed after the commit, see MediaCleanup
+        with transaction.atomic():
+            MediaCleanup.queue(self.images.values_list('image', flat=True))
+            return super().delete(*args, **kwargs)
+
+
+class ImagesQuerySet(models.QuerySet):
+    def delete_with_media(self):
+        """
+        Delete these images with set-based SQL in one transaction, and queue
+        their files for ``MediaCleanup``.
+        """
+        pks = self.values('pk')
+        with transaction.atomic():
+            MediaCleanup.queue(self.model.objects.filter(pk__in=pks).values_list(
+                'image', flat=True).distinct())
+            HotelInformation.objects.filter(pk__in=self.model.objects.filter(
+                pk__in=pks).values('hotel')).touch()
+            cache.invalidate_all_hotels()
+            return self.model.objects.filter(pk__in=pks).delete()
 
 
 class Images(models.Model):
-    image = models.ImageField(upload_to='images/', null=True)
+    image = models.ImageField(upload_to='images/', null=True, storage=image_storage)
     hotel = models.ForeignKey(
         HotelInformation,
         related_name='images',
         on_delete=models.CASCADE,
         null=True
     )
+    # Read from the file when it is stored (see polls.metadata), so readers
+    # know its shape without opening it
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    fileSize = models.PositiveBigIntegerField(null=True, blank=True)
+    format = models.CharField(max_length=10, null=True, blank=True)
+    contentHash = models.CharField(max_length=64, null=True, blank=True)
     createDate = models.DateTimeField(auto_now_add=True)
     updateDate = models.DateTimeField(null=True, blank=True)
 
+    objects = ImagesQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the admin, see polls.pagination
+            models.Index(fields=['createDate', 'id'], name='polls_images_created_id'),
+            models.Index(fields=['updateDate'], name='polls_images_updated'),
+            # Access checks of the media view (by name, renditions by
+            # prefix) and MediaCleanup
+            models.Index(fields=['image'], name='polls_images_image',
+                         opclasses=['varchar_pattern_ops']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['hotel', 'image'], name='polls_images_unique_hotel_image'),
+        ]
+
     def __str__(self):
         return os.path.basename(self.image.name) if self.image else "No image"
 
@@ -103,19 +305,191 @@ class Images(models.Model):
 
         if self.pk is not None:
             self.updateDate = timezone.now()
-        else:
-            if Images.objects.filter(hotel=self.hotel, image=self.image).exists():
-                raise ValueError(
-                    f"An image with the name {self.image} already exists for this hotel.")
 
-        super().save(*args, **kwargs)
+        # A file assigned but not stored yet, it is written by this save
+        new_file = bool(self.image) and not self.image._committed
+        if new_file or (self.image and self.contentHash is None):
+            self.fill_metadata()
+
+        # In one transaction with the file lock the storage takes, so
+        # MediaCleanup waits for the row. The same image twice for a hotel
+        # is rejected by polls_images_unique_hotel_image with an IntegrityError
+        with transaction.atomic():
+            if self.image and not new_file:
+                lock_files([self.image.name])
+            super().save(*args, **kwargs)
+        if new_file:
+            name = self.image.name
+            transaction.on_commit(
+                lambda: renditions.generate_in_background([name], image_storage))
+
+    def fill_metadata(self):
+        """Set the dimensions, size, format and content hash from the file, a new upload or the stored one."""
+        committed = self.image._committed
+        try:
+            if committed:
+                self.image.open('rb')
+            metadata = read_metadata(self.image.file)
+        except (InvalidImage, OSError) as e:
+            print(f"Error reading the metadata of {self.image.name}: {str(e)}")
+            return
+        finally:
+            if committed:
+                self.image.close()
+        for field, value in metadata._asdict().items():
+            setattr(self, field, value)
+
+    def rendition_url(self, rendition='thumbnail'):
+        """URL of a rendition of the image (see ``settings.IMAGE_RENDITIONS``), the original's until it is made."""
+        return renditions.rendition_url(self.image, rendition)
 
     def delete(self, *args, **kwargs):
-        if self.image:
-            image_path = os.path.join(settings.MEDIA_ROOT, str(self.image))
-            if os.path.isfile(image_path):
-                try:
-                    os.remove(image_path)
-                except Exception as e:
-                    print(f"Error deleting image file {image_path}: {str(e)}")
-        super().delete(*args, **kwargs)
+        # The file is removed after the commit, see MediaCleanup
+        with transaction.atomic():
+            MediaCleanup.queue([self.image.name])
+            if self.hotel_id is not None:
+                HotelInformation.objects.filter(pk=self.hotel_id).touch()
+                cache.invalidate_hotels([self.hotel_id])
+            return super().delete(*args, **kwargs)
+
+
+class ImportCheckpoint(models.Model):
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+
+    STATUS_CHOICES = [
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+    ]
+
+    source = models.CharField(max_length=500, unique=True)
+    keyColumn = models.CharField(max_length=200)
+    # High-water mark of the last completed run. With a key that is not
+    # the source id, the id of the last row of that key imported too, none
+    # when all rows of the key were
+    lastKey = models.CharField(max_length=200, null=True, blank=True)
+    lastId = models.CharField(max_length=200, null=True, blank=True)
+    # Progress of the current run, saved in the same transaction as each batch
+    resumeKey = models.CharField(max_length=200, null=True, blank=True)
+    resumeId = models.CharField(max_length=200, null=True, blank=True)
+    batchNumber = models.PositiveIntegerField(default=0)
+    rowsProcessed = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=COMPLETED,
+    )
+    createDate = models.DateTimeField(auto_now_add=True)
+    updateDate = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.source} ({self.keyColumn} > {self.lastKey})"
+
+    @staticmethod
+    def position(key, id):
+        # The ``after`` bound of polls.importer.source for a stored key and id
+        if key is None or id is None:
+            return key
+        return key, id
+
+    @property
+    def last_position(self):
+        return self.position(self.lastKey, self.lastId)
+
+    @property
+    def resume_position(self):
+        return self.position(self.resumeKey, self.resumeId)
+
+    def start(self, incremental):
+        self.status = self.RUNNING
+        self.resumeKey = self.lastKey if incremental else None
+        self.resumeId = self.lastId if incremental else None
+        self.batchNumber = 0
+        self.rowsProcessed = 0
+        self.save()
+
+    def record_batch(self, position, rows):
+        """Save the ``(key, id)`` position of the last row of a committed batch, see ``row_position``."""
+        key, id = position
+        self.resumeKey = str(key)
+        self.resumeId = None if id is None else str(id)
+        self.batchNumber += 1
+        self.rowsProcessed += rows
+        self.save()
+
+    def complete(self, advance=True):
+        if advance and self.resumeKey is not None:
+            self.lastKey = self.resumeKey
+            self.lastId = self.resumeId
+        self.status = self.COMPLETED
+        self.save()
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            self.updateDate = timezone.now()
+        super().save(*args, **kwargs)
+
+
+class MediaCleanup(models.Model):
+    """
+    Queue of image files to remove once no ``Images`` row references them
+    any more (files are shared by content, see ``polls.storage``). Entries
+    are written in the transaction that deletes the rows, so a rollback
+    never loses a file, and are processed after the commit by a background
+    thread and by the ``cleanup_media`` command.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    createDate = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def queue(cls, names):
+        names = {name for name in names if name}
+        if not names:
+            return
+        cls.objects.bulk_create(
+            [cls(name=name) for name in names], ignore_conflicts=True)
+        if settings.MEDIA_CLEANUP_IN_BACKGROUND:
+            transaction.on_commit(cls.process_in_background)
+
+    @classmethod
+    def process(cls, batch_size=500):
+        """
+        Remove the queued files that are no longer referenced, in batches
+        of ``batch_size``. Returns the number of files removed and kept.
+        """
+        removed = kept = 0
+        while True:
+            with transaction.atomic():
+                batch = cls.objects.order_by('pk')
+                if connection.features.has_select_for_update_skip_locked:
+                    # Concurrent workers take different batches
+                    batch = batch.select_for_update(skip_locked=True)
+                batch = list(batch[:batch_size])
+                if not batch:
+                    return removed, kept
+                names = {entry.name for entry in batch}
+                # Writers that found one of these files commit their rows first
+                lock_files(names)
+                referenced = set(Images.objects.filter(
+                    image__in=names).values_list('image', flat=True))
+                for name in names - referenced:
+                    try:
+                        image_storage.delete(name)
+                        renditions.delete_renditions(image_storage, name)
+                    except OSError as e:
+                        print(f"Error deleting image file {name}: {str(e)}")
+                cls.objects.filter(pk__in=[entry.pk for entry in batch]).delete()
+            removed += len(names - referenced)
+            kept += len(referenced)
+
+    @classmethod
+    def process_in_background(cls):
+        def run():
+            try:
+                cls.process()
+            finally:
+                connections.close_all()
+        threading.Thread(target=run, name='media-cleanup', daemon=True).start()
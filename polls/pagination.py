@@ -0,0 +1,155 @@
+import json
+
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+CURSOR_VAR = 'cursor'
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the row estimate of the PostgreSQL planner instead
+    of ``SELECT COUNT(*)`` once it is above
+    ``settings.ADMIN_ESTIMATED_COUNT_THRESHOLD``: ``pg_class.reltuples``
+    for a whole table, the ``EXPLAIN`` estimate for a filtered queryset.
+    Smaller results and other databases are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+            self.estimated = False
+            return super().count
+        self.estimated = True
+        return estimate
+
+    def validate_number(self, number):
+        # An estimate can be too low, so pages past it are still served
+        # (they are just empty if the estimate was right)
+        if self.count and self.estimated:
+            try:
+                number = int(number)
+            except (TypeError, ValueError):
+                return super().validate_number(number)
+            if number > self.num_pages:
+                return number
+        return super().validate_number(number)
+
+
+def estimate_count(queryset):
+    """Planner row estimate for ``queryset``, None when there is none."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where and not queryset.query.distinct:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            # -1 until the table has been vacuumed or analyzed once
+            return row[0] if row and row[0] >= 0 else None
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist that pages through the rows by seeking past the last row
+    shown (``?cursor=<createDate>,<id>``) instead of an ``OFFSET``, so deep
+    pages cost the same as the first one. Used while the list is in its
+    default ``keyset_ordering``; other orderings and searches keep the
+    numbered pages. The "Next" link of every page in that ordering is a
+    cursor, see ``admin/polls/pagination.html``.
+    """
+
+    keyset_ordering = ('-createDate', '-id')
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Sorting, filtering or searching starts again from the first page
+        return super().get_query_string(new_params, [CURSOR_VAR, *(remove or [])])
+
+    @property
+    def keyset_active(self):
+        # The admin's own ordering is repeated after it, only the lead counts
+        order_by = tuple(self.queryset.query.order_by)
+        return order_by[:len(self.keyset_ordering)] == self.keyset_ordering
+
+    def get_results(self, request):
+        if not self.keyset_active:
+            super().get_results(request)
+            return
+        if self.cursor is None:
+            super().get_results(request)
+            rows = list(self.result_list)
+            if self.multi_page and not self.show_all and len(rows) == self.list_per_page:
+                self.set_next_cursor(rows)
+            return
+
+        paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page)
+        rows = list(self.queryset.filter(self.seek_filter())[:self.list_per_page + 1])
+        self.result_list = rows[:self.list_per_page]
+        if len(rows) > self.list_per_page:
+            self.set_next_cursor(self.result_list)
+        self.result_count = paginator.count
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.full_result_count = (
+            self.root_queryset.count() if self.show_full_result_count else None)
+        self.show_admin_actions = not self.show_full_result_count or bool(
+            self.full_result_count)
+        # No page numbers (and no "Show all") while seeking
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = paginator
+
+    @property
+    def keyset_fields(self):
+        return [name.lstrip('-') for name in self.keyset_ordering]
+
+    def seek_filter(self):
+        """Rows after the cursor in ``keyset_ordering`` (both fields descending)."""
+        date_name, id_name = self.keyset_fields
+        try:
+            date_value, id_value = self.cursor.rsplit(',', 1)
+            date_value = self.lookup_opts.get_field(date_name).to_python(date_value)
+            id_value = self.lookup_opts.get_field(id_name).to_python(id_value)
+        except (ValueError, ValidationError) as e:
+            raise IncorrectLookupParameters(e)
+        return (Q(**{f'{date_name}__lt': date_value})
+                | Q(**{date_name: date_value, f'{id_name}__lt': id_value}))
+
+    def set_next_cursor(self, rows):
+        if rows:
+            date_name, id_name = self.keyset_fields
+            last = rows[-1]
+            self.next_cursor = f'{getattr(last, date_name).isoformat()},{getattr(last, id_name)}'
+
+    @property
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor}, [PAGE_VAR])
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string(remove=[PAGE_VAR])
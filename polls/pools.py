@@ -0,0 +1,86 @@
+"""
+Worker pools of the image pipeline: ``ImageCopyPool`` (polls.importer.copier),
+``RenditionPool`` (polls.renditions) and ``MetadataPool`` (polls.metadata).
+"""
+import multiprocessing
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class WorkerPool:
+    """
+    Runs jobs on ``workers`` threads, or processes with ``processes`` set,
+    while the caller keeps working; with ``workers=0`` they run inline.
+    ``run`` blocks once ``max_pending`` jobs are queued (by default
+    ``pending_per_worker`` per worker) so memory stays bounded. Results go
+    to ``completed``, exceptions to ``failed``, which counts and keeps them
+    in ``stats`` and ``errors``.
+    """
+
+    processes = False
+    pending_per_worker = 64
+    thread_name_prefix = ''
+
+    def __init__(self, workers, max_pending=None):
+        self.workers = workers
+        self.stats = Counter()
+        self.errors = []
+        self._lock = threading.Lock()
+        self._executor = None
+        if workers > 0 and self.processes:
+            # Spawned, the workers only run the module level function of
+            # the job and need no Django
+            self._executor = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn'))
+        elif workers > 0:
+            self._executor = ThreadPoolExecutor(
+                workers, thread_name_prefix=self.thread_name_prefix)
+        self._slots = threading.BoundedSemaphore(
+            max_pending or max(workers, 1) * self.pending_per_worker)
+
+    def run(self, job, function, *args):
+        """Call ``function(*args)`` for ``job`` on a worker."""
+        if self._executor is None:
+            try:
+                result = function(*args)
+            except Exception as e:
+                self.failed(job, e)
+                return
+            self.completed(job, result)
+            return
+        self._slots.acquire()
+        future = self._executor.submit(function, *args)
+        future.add_done_callback(lambda future: self._done(job, future))
+
+    def _done(self, job, future):
+        self._slots.release()
+        try:
+            result = future.result()
+        except Exception as e:
+            self.failed(job, e)
+            return
+        self.completed(job, result)
+
+    def completed(self, job, result):
+        pass
+
+    def failed(self, job, error):
+        with self._lock:
+            self.stats['failed'] += 1
+            self.errors.append((job, error))
+
+    def count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        return self.stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
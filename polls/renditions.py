@@ -0,0 +1,163 @@
+"""
+Resized and compressed WebP renditions of the stored images.
+
+Every image file gets the renditions of ``settings.IMAGE_RENDITIONS``,
+stored next to it: ``images/ab/cd/<digest>.jpg`` has
+``images/ab/cd/<digest>.thumbnail.webp`` and so on. Files are shared by
+content (see ``polls.storage``) and so are their renditions; they are
+removed together with the file by ``MediaCleanup``.
+
+Renditions are made on worker processes, after the commit that saves an
+image (``Images.save``) and while ``import_data`` copies the files.
+``rendition_url`` falls back to the original until they exist.
+"""
+import multiprocessing
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from polls.pools import WorkerPool
+
+EXTENSION = '.webp'
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def rendition_name(name, rendition):
+    return f'{os.path.splitext(name)[0]}.{rendition}{EXTENSION}'
+
+
+def original_prefix(name):
+    """``'<directory>/<stem>.'`` of the original of a rendition name, None for other names."""
+    directory, filename = posixpath.split(name)
+    parts = filename.rsplit('.', 2)
+    if len(parts) == 3 and f'.{parts[2]}' == EXTENSION and parts[1] in settings.IMAGE_RENDITIONS:
+        return posixpath.join(directory, f'{parts[0]}.')
+    return None
+
+
+def rendition_url(image, rendition):
+    """URL of the ``rendition`` of an image field file, or of the original while it is missing."""
+    if not image:
+        return None
+    name = rendition_name(image.name, rendition)
+    if rendition in settings.IMAGE_RENDITIONS and image.storage.exists(name):
+        return image.storage.url(name)
+    return image.url
+
+
+def render(path, specs, quality):
+    """
+    Write the missing renditions of the image file at ``path``, ``specs``
+    being ``(rendition, size)`` pairs. Returns how many were written. Runs
+    on the worker processes, so it is given everything it needs.
+    """
+    missing = [(rendition_name(path, rendition), size) for rendition, size in specs
+               if not os.path.exists(rendition_name(path, rendition))]
+    if not missing:
+        return 0
+    with Image.open(path) as original:
+        if all(size for _, size in missing):
+            # JPEG can be decoded at 1/2, 1/4 or 1/8 of its size, far cheaper
+            # than decoding it whole and scaling it down; the square keeps
+            # enough pixels whatever the EXIF orientation
+            largest = max(max(size) for _, size in missing)
+            original.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        for destination, size in missing:
+            rendition = image
+            if size:
+                rendition = image.copy()
+                rendition.thumbnail(size, Image.Resampling.LANCZOS)
+            # Written under a temporary name, so a rendition that exists is
+            # complete; per thread, as copy threads may render the same file
+            partial = f'{destination}.{os.getpid()}.{threading.get_ident()}.part'
+            try:
+                rendition.save(partial, 'WEBP', quality=quality, method=4)
+                os.replace(partial, destination)
+            except BaseException:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                raise
+    return len(missing)
+
+
+def rendition_specs():
+    return list(settings.IMAGE_RENDITIONS.items())
+
+
+def delete_renditions(storage, name):
+    """Remove the renditions of the stored file ``name``, also of renditions no longer configured."""
+    directory, filename = posixpath.split(name)
+    prefix = f'{os.path.splitext(filename)[0]}.'
+    try:
+        files = storage.listdir(directory)[1]
+    except FileNotFoundError:
+        return
+    for file in files:
+        if file.startswith(prefix) and file.endswith(EXTENSION):
+            storage.delete(posixpath.join(directory, file))
+
+
+class RenditionPool(WorkerPool):
+    """
+    Makes the renditions of image files on a pool of processes, Pillow's
+    resizing and encoding being CPU bound, see ``WorkerPool``. ``errors``
+    lists ``(path, error)``.
+    """
+
+    processes = True
+    pending_per_worker = 16
+
+    def __init__(self, workers=None, max_pending=None):
+        if workers is None:
+            workers = settings.IMAGE_RENDITION_WORKERS
+        super().__init__(workers, max_pending)
+        self._specs = rendition_specs()
+        self._quality = settings.IMAGE_RENDITION_QUALITY
+
+    def submit(self, path):
+        self.run(path, render, path, self._specs, self._quality)
+
+    def completed(self, path, written):
+        self.count('rendered' if written else 'skipped')
+        self.count('renditions', written)
+
+
+def generate_in_background(names, storage):
+    """Make the renditions of the stored files ``names``, for ``Images.save``."""
+    global _background
+    paths = [storage.path(name) for name in names if name]
+    if not paths:
+        return
+    if not settings.IMAGE_RENDITIONS_IN_BACKGROUND:
+        for path in paths:
+            try:
+                render(path, rendition_specs(), settings.IMAGE_RENDITION_QUALITY)
+            except Exception as e:
+                print(f"Error making the renditions of {path}: {str(e)}")
+        return
+    with _background_lock:
+        if _background is None:
+            _background = ProcessPoolExecutor(
+                max(settings.IMAGE_RENDITION_WORKERS, 1),
+                mp_context=multiprocessing.get_context('spawn'))
+    for path in paths:
+        future = _background.submit(
+            render, path, rendition_specs(), settings.IMAGE_RENDITION_QUALITY)
+        future.add_done_callback(report_errors(path))
+
+
+def report_errors(path):
+    def report(future):
+        if future.exception() is not None:
+            print(f"Error making the renditions of {path}: {str(future.exception())}")
+    return report
@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.db.models import Prefetch
+
+from polls.models import HotelInformation, Location, Amenities, Images
+
+
+class Field:
+    """
+    One field of an API resource: ``get`` reads it from an object, and
+    ``only``/``select_related``/``prefetch`` are what the query needs to
+    load it, so a response never queries per object.
+    """
+
+    def __init__(self, get, only=(), select_related=(), prefetch=()):
+        self.get = get
+        self.only = only
+        self.select_related = select_related
+        self.prefetch = prefetch
+
+
+def attribute(name):
+    return Field(lambda obj: getattr(obj, name), only=(name,))
+
+
+def image_url(image):
+    return image.image.url if image.image else None
+
+
+def rendition_urls(image):
+    return {name: image.rendition_url(name) for name in settings.IMAGE_RENDITIONS} if image.image else None
+
+
+class Serializer:
+    """
+    Turns objects of ``model`` into dicts with the requested subset of
+    ``fields`` (``default_fields`` when none is asked for), and builds the
+    queryset that loads exactly those.
+    """
+
+    model = None
+    fields = {}
+    default_fields = ()
+
+    def __init__(self, names=None):
+        names = list(dict.fromkeys(names or self.default_fields))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValueError(
+                f"Unknown field(s): {', '.join(unknown)}. "
+                f"Available fields: {', '.join(self.fields)}")
+        # The id is always returned, the cursor is built from it
+        self.names = ['id', *(name for name in names if name != 'id')]
+
+    def get_queryset(self, only=(), prefetch=True):
+        """
+        Queryset loading the selected fields, and the model fields in
+        ``only``. With ``prefetch=False`` the relations are left to
+        ``prefetch_lookups()``, e.g. for ``aprefetch_related_objects``.
+        """
+        queryset = self.model.objects.all()
+        only = set(only)
+        select_related = set()
+        for name in self.names:
+            field = self.fields[name]
+            only.update(field.only)
+            select_related.update(field.select_related)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        queryset = queryset.only(*only)
+        if prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch_lookups())
+        return queryset
+
+    def prefetch_lookups(self):
+        return [lookup for name in self.names for lookup in self.fields[name].prefetch]
+
+    def to_dict(self, obj):
+        return {name: self.fields[name].get(obj) for name in self.names}
+
+
+class HotelSerializer(Serializer):
+    model = HotelInformation
+    fields = {
+        'id': attribute('id'),
+        'title': attribute('title'),
+        'description': attribute('description'),
+        'locations': Field(
+            lambda hotel: [
+                {'id': location.id, 'name': location.name, 'type': location.type,
+                 'latitude': location.latitude, 'longitude': location.longitude}
+                for location in hotel.locations.all()],
+            prefetch=[Prefetch('locations', queryset=Location.objects.only(
+                'id', 'name', 'type', 'latitude', 'longitude'))]),
+        'amenities': Field(
+            lambda hotel: [amenity.name for amenity in hotel.amenities.all()],
+            prefetch=[Prefetch('amenities', queryset=Amenities.objects.only('id', 'name'))]),
+        'images': Field(
+            lambda hotel: [image_url(image) for image in hotel.images.all()],
+            prefetch=[Prefetch('images', queryset=Images.objects.only('id', 'hotel_id', 'image'))]),
+        'createDate': attribute('createDate'),
+        'updateDate': attribute('updateDate'),
+    }
+    default_fields = ('title', 'description', 'locations', 'amenities', 'images',
+                      'createDate', 'updateDate')
+
+
+class LocationSerializer(Serializer):
+    model = Location
+    fields = {
+        'id': attribute('id'),
+        'name': attribute('name'),
+        'type': attribute('type'),
+        'latitude': attribute('latitude'),
+        'longitude': attribute('longitude'),
+        # Not returned by default, a city can have thousands of hotels
+        'hotels': Field(
+            lambda location: [hotel.id for hotel in location.hotels.all()],
+            prefetch=[Prefetch('hotels', queryset=HotelInformation.objects.only('id'))]),
+        'createDate': attribute('createDate'),
+        'updateDate': attribute('updateDate'),
+    }
+    default_fields = ('name', 'type', 'latitude', 'longitude', 'createDate', 'updateDate')
+
+
+class AmenitySerializer(Serializer):
+    model = Amenities
+    fields = {
+        'id': attribute('id'),
+        'name': attribute('name'),
+        # Not returned by default, see LocationSerializer
+        'hotels': Field(
+            lambda amenity: [hotel.id for hotel in amenity.hotels.all()],
+            prefetch=[Prefetch('hotels', queryset=HotelInformation.objects.only('id'))]),
+        'createDate': attribute('createDate'),
+        'updateDate': attribute('updateDate'),
+    }
+    default_fields = ('name', 'createDate', 'updateDate')
+
+
+class ImageSerializer(Serializer):
+    model = Images
+    fields = {
+        'id': attribute('id'),
+        'url': Field(image_url, only=('image',)),
+        # Not returned by default, each one is looked up on the storage
+        'renditions': Field(rendition_urls, only=('image',)),
+        'width': attribute('width'),
+        'height': attribute('height'),
+        'fileSize': attribute('fileSize'),
+        'format': attribute('format'),
+        'contentHash': attribute('contentHash'),
+        'hotel': Field(lambda image: image.hotel_id, only=('hotel',)),
+        'hotelTitle': Field(
+            lambda image: image.hotel.title if image.hotel else None,
+            only=('hotel__id', 'hotel__title'), select_related=('hotel',)),
+        'createDate': attribute('createDate'),
+        'updateDate': attribute('updateDate'),
+    }
+    default_fields = ('url', 'hotel', 'createDate', 'updateDate')
@@ -0,0 +1,81 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from polls import cache
+from polls.models import HotelInformation, Location, Amenities, Images
+
+
+# Keep HotelInformation.searchVector in step with everything it is built
+# from, and give the cached API responses of the hotels a new version, see
+# polls.cache
+
+@receiver(post_save, sender=HotelInformation)
+def update_hotel_search_vector(sender, instance, raw=False, **kwargs):
+    if not raw:
+        HotelInformation.objects.filter(pk=instance.pk).update_search_vectors()
+        cache.invalidate_hotels([instance.pk])
+
+
+# Not sent by delete_with_media(), which invalidates all hotels once
+@receiver(post_delete, sender=HotelInformation)
+def invalidate_deleted_hotel(sender, instance, **kwargs):
+    cache.invalidate_hotels([instance.pk])
+
+
+# Deleted images are handled in Images.delete() and delete_with_media(): a
+# post_delete receiver would stop Django from deleting a hotel's images with
+# a single DELETE
+@receiver(post_save, sender=Images)
+def invalidate_image_hotel(sender, instance, raw=False, **kwargs):
+    if instance.hotel_id is not None and not raw:
+        cache.invalidate_hotels([instance.hotel_id])
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Amenities)
+def update_related_search_vectors(sender, instance, created, raw=False, **kwargs):
+    # A new location or amenity has no hotels yet
+    if not created and not raw:
+        hotels = instance.hotels.all()
+        hotels.update_search_vectors()
+        cache.invalidate_hotels(hotels.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=HotelInformation.locations.through)
+@receiver(m2m_changed, sender=HotelInformation.amenities.through)
+def update_linked_search_vectors(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # After the clear there is no way left to find the hotels
+        instance._linked_hotels = list(
+            instance.hotels.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        hotel_ids = [instance.pk]
+    elif action == 'post_clear':
+        hotel_ids = instance.__dict__.pop('_linked_hotels', [])
+    else:
+        hotel_ids = pk_set
+    hotels = HotelInformation.objects.filter(pk__in=hotel_ids)
+    # No date of the hotel or the linked row changes otherwise, see
+    # with_last_change()
+    hotels.touch()
+    hotels.update_search_vectors()
+    cache.invalidate_hotels(hotel_ids)
+
+
+@receiver(pre_delete, sender=Location)
+@receiver(pre_delete, sender=Amenities)
+def remember_related_hotels(sender, instance, **kwargs):
+    instance._linked_hotels = list(
+        instance.hotels.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=Amenities)
+def update_unlinked_search_vectors(sender, instance, **kwargs):
+    hotel_ids = instance.__dict__.pop('_linked_hotels', [])
+    hotels = HotelInformation.objects.filter(pk__in=hotel_ids)
+    hotels.touch()
+    hotels.update_search_vectors()
+    cache.invalidate_hotels(hotel_ids)
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 1024 * 1024
+# First key of the two-key advisory locks taken on stored file names
+FILE_LOCK_NAMESPACE = 1835361385
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names every file after the SHA-256 of its
+    content, sharded over two directory levels, e.g.
+    ``images/ab/cd/abcd...ef.jpg``. A file whose content is already stored
+    is not written again, its existing name is returned instead, so many
+    ``Images`` rows can share one file. Rows count as the references to a
+    file, see ``Images.delete``. Saving locks the name until the end of
+    the transaction (``lock_files``), so a file found here is not removed
+    by ``MediaCleanup`` before the row pointing at it is committed.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content_digest(content))
+        lock_files([name])
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def hashed_name(self, name, digest):
+        """Content addressed name for ``name`` (only its directory and extension are kept)."""
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2], digest[2:4], digest + extension)
+
+
+def lock_files(names):
+    """
+    Take transaction level advisory locks on the given stored file names,
+    in a fixed order so writers and ``MediaCleanup`` can not deadlock.
+    Writers take them before looking for a file they will reference and
+    hold them until their rows are committed, the cleanup before checking
+    that a file is unreferenced and until it is removed. Only PostgreSQL,
+    and only inside a transaction: in autocommit mode the lock is released
+    at once.
+    """
+    if connection.vendor != 'postgresql' or not names:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, key) FROM ('
+            ' SELECT DISTINCT hashtext(name) AS key'
+            ' FROM unnest(%s::text[]) AS name ORDER BY key'
+            ') AS keys',
+            [FILE_LOCK_NAMESPACE, list(names)])
+
+
+def content_digest(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def path_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+image_storage = ContentAddressedStorage()
@@ -0,0 +1,14 @@
+from django import template
+
+from polls.renditions import rendition_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition(image, name='thumbnail'):
+    """
+    URL of a rendition of an ``Images`` row or of its image field, e.g.
+    ``<img src="{% rendition image 'medium' %}">``.
+    """
+    return rendition_url(getattr(image, 'image', image), name)
@@ -1,3 +1,466 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib import admin
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.db.models import Case, Value, When
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from PIL import Image
+
+from polls.benchmarks import SyntheticData, populate
+from polls.importer.bulk import BulkImporter, insert_new
+from polls.importer.source import build_source_query, row_position
+from polls.instrumentation import QueryBudget, QueryRecorder, QueryStatistics
+from polls.media import parse_range
+from polls.models import (
+    Amenities, HotelInformation, HotelInformationQuerySet, Images, ImportCheckpoint, Location,
+    MediaCleanup)
+from polls.renditions import render, rendition_name, rendition_specs
+from polls.storage import image_storage
+
+# Queries per page of every polls admin: ``(changelist, change view)``,
+# each ``(queries, duplicates)``. They include the session and user
+# lookups, and for the changelists with EstimatedCountPaginator the planner
+# estimate it reads on PostgreSQL (one query less elsewhere). None depends
+# on the number of rows, so a query per row or per related object goes
+# far past them.
+ADMIN_BUDGETS = {
+    HotelInformation: ((12, 0), (10, 0)),
+    Images: ((7, 0), (5, 0)),
+    Location: ((6, 0), (5, 0)),
+    Amenities: ((6, 0), (5, 0)),
+    # The COUNT(*) runs twice, for the page and the full result count
+    ImportCheckpoint: ((5, 1), (4, 0)),
+}
+
+
+class AdminQueryBudgetTests(TestCase):
+    """The queries of the admin pages, over more rows than a changelist page shows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        populate(SyntheticData(150, distinct_images=0), images_dir='')
+        # Rows only, the admin pages do not open the files
+        Images.objects.bulk_create([
+            Images(hotel=hotel, image=f'images/{hotel.pk:02x}/{number}.jpg')
+            for hotel in HotelInformation.objects.all() for number in range(3)])
+        ImportCheckpoint.objects.create(source='localhost:5432/hotel', keyColumn='id')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # The filter counts of TopRelatedFieldListFilter are cached
+        cache.clear()
+
+    def test_every_admin_has_a_budget(self):
+        registered = {model for model in admin.site._registry if model._meta.app_label == 'polls'}
+        self.assertEqual(registered, set(ADMIN_BUDGETS))
+
+    def test_changelist_budgets(self):
+        for model, ((queries, duplicates), _) in ADMIN_BUDGETS.items():
+            with self.subTest(model=model.__name__):
+                url = reverse(f'admin:polls_{model._meta.model_name}_changelist')
+                with QueryBudget(self, queries, duplicates):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_change_view_budgets(self):
+        for model, (_, (queries, duplicates)) in ADMIN_BUDGETS.items():
+            with self.subTest(model=model.__name__):
+                obj = model.objects.order_by('pk').first()
+                url = reverse(f'admin:polls_{model._meta.model_name}_change', args=[obj.pk])
+                with QueryBudget(self, queries, duplicates):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_search_budget(self):
+        url = reverse('admin:polls_hotelinformation_changelist')
+        (queries, duplicates), _ = ADMIN_BUDGETS[HotelInformation]
+        with QueryBudget(self, queries, duplicates):
+            response = self.client.get(url, {'q': 'Grand Hotel'})
+        self.assertEqual(response.status_code, 200)
+
+
+class HotelAdminSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        # Newest first in the default ordering, weakest match first
+        cls.title_match = HotelInformation.objects.create(title='Grand Hotel', description='Rooms')
+        cls.description_match = HotelInformation.objects.create(
+            title='Seaside Inn', description='A grand view of the bay')
+        HotelInformation.objects.create(title='Mountain Lodge', description='Quiet rooms')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def search(self, term, **params):
+        response = self.client.get(
+            reverse('admin:polls_hotelinformation_changelist'), {'q': term, **params})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['cl'].result_list)
+
+    def test_search_lists_matches(self):
+        self.assertIn(self.title_match, self.search('Grand'))
+
+    def test_rank_order_survives_the_changelist(self):
+        # The changelist's ordering with a rank like the full text search's,
+        # on any database
+        def search(queryset, term):
+            return queryset.filter(title__in=['Grand Hotel', 'Seaside Inn']).annotate(
+                rank=Case(When(title='Seaside Inn', then=Value(1.0)), default=Value(0.5)))
+
+        with mock.patch('polls.admin.connection', mock.Mock(vendor='postgresql')), \
+                mock.patch.object(HotelInformationQuerySet, 'search', search):
+            self.assertEqual(self.search('grand'), [self.description_match, self.title_match])
+            self.assertEqual(self.search('grand', o='1'), [self.title_match, self.description_match])
+
+    @skipUnless(connection.vendor == 'postgresql', 'full text search needs PostgreSQL')
+    def test_search_orders_by_rank(self):
+        self.assertEqual(self.search('grand'), [self.title_match, self.description_match])
+
+    @skipUnless(connection.vendor == 'postgresql', 'full text search needs PostgreSQL')
+    def test_sorted_column_wins_over_rank(self):
+        # Title descending, column 0 is the action checkbox
+        self.assertEqual(self.search('grand', o='-1'), [self.description_match, self.title_match])
+
+
+class QueryInstrumentationTests(TestCase):
+    def test_budget_fails_past_the_queries(self):
+        with self.assertRaisesMessage(AssertionError, 'Query budget of 1 queries'):
+            with QueryBudget(self, 1):
+                list(Location.objects.all())
+                list(Amenities.objects.all())
+
+    def test_budget_fails_on_duplicates(self):
+        with self.assertRaisesMessage(AssertionError, '2x SELECT'):
+            with QueryBudget(self, 5):
+                list(Location.objects.all())
+                list(Location.objects.all())
+
+    def test_recorder_reports_similar_queries(self):
+        locations = Location.objects.bulk_create([
+            Location(name=f'Location {number}', latitude=number, longitude=number)
+            for number in range(3)])
+        with QueryRecorder() as recorder:
+            for location in locations:
+                list(location.hotels.all())
+        self.assertEqual(recorder.count, 3)
+        self.assertEqual(recorder.duplicate_count, 0)
+        self.assertEqual(recorder.similar()[0][1], 3)
+
+    def test_statistics_keep_totals_only(self):
+        with QueryStatistics(limit=2) as statistics:
+            for number in range(10):
+                list(Location.objects.filter(pk=number))
+            list(Amenities.objects.all())
+        self.assertEqual(statistics.count, 11)
+        self.assertEqual(len(statistics.statements), 2)
+        self.assertEqual(statistics.similar()[0][1], 10)
+        self.assertEqual(len(statistics.slowest()), 2)
+        self.assertIn('Slowest:', statistics.report())
+
+    @override_settings(QUERY_INSTRUMENTATION_HEADERS=True)
+    def test_middleware_headers(self):
+        cache.clear()
+        response = self.client.get(reverse('api-sync-hotel-detail', args=[1]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.headers['X-DB-Queries'], '1')
+        self.assertIn('db;dur=', response.headers['Server-Timing'])
+
+
+class HotelCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hotel = HotelInformation.objects.create(title='Grand Hotel', description='By the sea')
+        cls.location = Location.objects.create(name='Lisbon', latitude=38.7, longitude=-9.1)
+        cls.hotel.locations.add(cls.location)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, name, *args, **headers):
+        response = self.client.get(reverse(name, args=args), headers=headers)
+        if response.streaming:
+            # Sending the body caches it
+            b''.join(response.streaming_content)
+        return response
+
+    def test_detail_not_modified(self):
+        for name in ('api-hotel-detail', 'api-sync-hotel-detail'):
+            with self.subTest(name=name):
+                response = self.get(name, self.hotel.pk)
+                self.assertEqual(response.status_code, 200)
+                etag = response.headers['ETag']
+                with QueryBudget(self, 0):
+                    response = self.get(name, self.hotel.pk, if_none_match=etag)
+                self.assertEqual(response.status_code, 304)
+                response = self.get(name, self.hotel.pk,
+                                    if_modified_since=response.headers['Last-Modified'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_list_not_modified_once_cached(self):
+        # Streamed on a miss, without validators
+        self.assertNotIn('ETag', self.get('api-sync-hotel-list').headers)
+        etag = self.get('api-sync-hotel-list').headers['ETag']
+        with QueryBudget(self, 0):
+            response = self.get('api-sync-hotel-list', if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_async_list_not_modified_once_cached(self):
+        url = reverse('api-hotel-list')
+        response = await self.async_client.get(url)
+        self.assertNotIn('ETag', response.headers)
+        [chunk async for chunk in response]
+        etag = (await self.async_client.get(url)).headers['ETag']
+        response = await self.async_client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_validators_are_the_same_in_every_process(self):
+        etag = self.get('api-sync-hotel-detail', self.hotel.pk).headers['ETag']
+        # What another process, with its own tokens, renders
+        cache.clear()
+        self.assertEqual(self.get('api-sync-hotel-detail', self.hotel.pk).headers['ETag'], etag)
+
+    def test_change_invalidates(self):
+        response = self.get('api-sync-hotel-detail', self.hotel.pk)
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.name = 'Porto'
+            self.location.save()
+        response = self.get('api-sync-hotel-detail', self.hotel.pk, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['locations'][0]['name'], 'Porto')
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertGreaterEqual(response.headers['Last-Modified'], last_modified)
+
+    def test_link_change_is_modified(self):
+        porto = Location.objects.create(name='Porto', latitude=41.1, longitude=-8.6)
+        for change in (lambda: self.hotel.locations.add(porto),
+                       lambda: porto.hotels.remove(self.hotel)):
+            # Every date a second or more in the past, as Last-Modified has
+            # no finer resolution
+            a_day_ago = timezone.now() - timedelta(days=1)
+            for model in (HotelInformation, Location):
+                model.objects.update(createDate=a_day_ago, updateDate=None)
+            cache.clear()
+            last_modified = self.get('api-sync-hotel-detail', self.hotel.pk).headers['Last-Modified']
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            response = self.get('api-sync-hotel-detail', self.hotel.pk,
+                                if_modified_since=last_modified)
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(parse_http_date(response.headers['Last-Modified']),
+                               parse_http_date(last_modified))
+
+    def test_missed_change_expires(self):
+        etag = self.get('api-sync-hotel-detail', self.hotel.pk).headers['ETag']
+        # A change this process's tokens do not see, like one of another
+        # process with a local memory cache
+        HotelInformation.objects.filter(pk=self.hotel.pk).update(title='Hotel Central')
+        self.assertEqual(self.get('api-sync-hotel-detail', self.hotel.pk).headers['ETag'], etag)
+        later = time.time() + settings.HOTEL_CACHE_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            response = self.get('api-sync-hotel-detail', self.hotel.pk, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Hotel Central')
+
+
+class SourceQueryTests(SimpleTestCase):
+    def test_id_key(self):
+        query, params = build_source_query('id', after=5, until=9)
+        self.assertIn('"id" > %s AND "id" <= %s ORDER BY "id"', query.as_string(None))
+        self.assertEqual(params, [5, 9])
+        self.assertEqual(row_position('id', (None,) * 8 + (9,)), (9, None))
+
+    def test_timestamp_key_orders_by_id(self):
+        query, params = build_source_query('updated', after=('2024-01-01', 7))
+        sql = query.as_string(None)
+        self.assertIn('"updated", "id" FROM', sql)
+        self.assertIn('("updated", "id") > (%s, %s) ORDER BY "updated", "id"', sql)
+        self.assertEqual(params, ['2024-01-01', 7])
+        self.assertEqual(row_position('updated', (None,) * 8 + ('2024-01-02', 3)), ('2024-01-02', 3))
+
+
+class BulkImporterTests(TestCase):
+    def test_conflicting_rows_are_not_counted(self):
+        Location.objects.create(name='Lisbon', latitude=38.7, longitude=-9.1)
+        rows = [('Grand Hotel', '38.7', '-9.1', 'Lisbon', None, None, None, []),
+                ('Porto Inn', '41.1', '-8.6', 'Porto', None, None, None, [])]
+        importer = BulkImporter('')
+        fetch_locations = importer.fetch_locations
+        lookups = []
+
+        def fetch(keys):
+            # The first lookup misses Lisbon, as if another importer had
+            # inserted it since
+            lookups.append(keys)
+            return fetch_locations(keys) if len(lookups) > 1 else {}
+
+        with mock.patch.object(importer, 'fetch_locations', fetch):
+            locations = importer.resolve_locations(rows)
+        self.assertEqual(set(locations), {('Lisbon', 38.7, -9.1), ('Porto', 41.1, -8.6)})
+        self.assertEqual(importer.stats['locations_created'], 1)
+
+    def test_insert_new_counts_inserted_rows(self):
+        hotel = HotelInformation.objects.create(title='Grand Hotel')
+        Images.objects.bulk_create([Images(hotel=hotel, image='images/a.jpg')])
+        for names, inserted in ((['images/a.jpg'], 0), (['images/a.jpg', 'images/b.jpg'], 1)):
+            with self.subTest(names=names):
+                self.assertEqual(insert_new([Images(hotel=hotel, image=name) for name in names]), inserted)
+        self.assertEqual(hotel.images.count(), 2)
+
+
+@override_settings(MEDIA_CLEANUP_IN_BACKGROUND=False)
+class DeleteWithMediaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        populate(SyntheticData(60, distinct_images=0), images_dir='')
+        Images.objects.bulk_create([
+            Images(hotel=hotel, image=f'images/{hotel.pk:02x}/{number}.jpg')
+            for hotel in HotelInformation.objects.all() for number in range(2)])
+
+    def test_deletes_a_batch_at_a_time(self):
+        # Filtered on the images deleted on the way. The primary keys, six
+        # queries for each of the three batches and the savepoint: no query
+        # or on_commit callback per hotel
+        hotels = HotelInformation.objects.filter(images__isnull=False).distinct()
+        with self.captureOnCommitCallbacks() as callbacks, QueryBudget(self, 21):
+            total, deleted = hotels.delete_with_media(batch_size=25)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(deleted['polls.HotelInformation'], 60)
+        self.assertEqual(deleted['polls.Images'], 120)
+        self.assertEqual(total, sum(deleted.values()))
+        self.assertFalse(HotelInformation.objects.exists())
+        self.assertFalse(HotelInformation.locations.through.objects.exists())
+        self.assertEqual(MediaCleanup.objects.count(), 120)
+
+
+class ImportCheckpointTests(TestCase):
+    def test_position_survives_runs(self):
+        checkpoint = ImportCheckpoint.objects.create(source='localhost:5432/hotel', keyColumn='updated')
+        checkpoint.start(incremental=True)
+        self.assertIsNone(checkpoint.resume_position)
+        checkpoint.record_batch(('2024-01-01', 7), 100)
+        checkpoint.complete()
+        checkpoint.start(incremental=True)
+        self.assertEqual(checkpoint.resume_position, ('2024-01-01', '7'))
+        # A run over whole keys, e.g. with --processes
+        checkpoint.resumeKey, checkpoint.resumeId = '2024-02-01', None
+        checkpoint.complete()
+        self.assertEqual(checkpoint.last_position, '2024-02-01')
+
+
+class RenderTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'photo.jpg')
+        Image.new('RGB', (1600, 1200), 'teal').save(self.path)
+
+    def test_render_from_several_threads(self):
+        # Copy threads render inline, several of them may get the same file
+        threads = 8
+        start = threading.Barrier(threads)
+
+        def run():
+            start.wait()
+            return render(self.path, rendition_specs(), 80)
+
+        with ThreadPoolExecutor(threads) as executor:
+            written = [future.result() for future in [executor.submit(run) for _ in range(threads)]]
+        self.assertTrue(all(count <= len(rendition_specs()) for count in written))
+        for rendition, _ in rendition_specs():
+            with Image.open(rendition_name(self.path, rendition)) as image:
+                self.assertEqual(image.format, 'WEBP')
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(
+            ['photo.jpg', *(os.path.basename(rendition_name(self.path, rendition))
+                            for rendition, _ in rendition_specs())]))
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-200', 100), (0, 99))
+
+    def test_whole_file(self):
+        for header in (None, '', 'bytes=-', 'bytes=0-1,5-6', 'items=0-9', 'bytes=5-2'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 100))
+
+    def test_not_satisfiable(self):
+        for header, size in (('bytes=100-', 100), ('bytes=150-200', 100), ('bytes=-0', 100), ('bytes=-5', 0)):
+            with self.subTest(header=header):
+                with self.assertRaises(ValueError):
+                    parse_range(header, size)
+
+
+class MediaFileTests(TestCase):
+    content = bytes(range(256)) * 4
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root, MEDIA_SERVER='')
+        cls.settings_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root)
+
+    def setUp(self):
+        name = image_storage.save('images/photo.jpg', ContentFile(self.content))
+        # A row without saving the model, which would read the bytes as an image
+        Images.objects.bulk_create([Images(image=name)])
+        self.url = f'/media/{name}'
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+
+    def test_partial_content(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+    def test_not_satisfiable(self):
+        response = self.client.get(self.url, headers={'Range': f'bytes={len(self.content)}-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_invalid_range_sends_whole_file(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=5-2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url).headers['ETag']
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_unused_file_is_not_served(self):
+        Images.objects.all().delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
@@ -4,4 +4,16 @@ from . import views
 
 urlpatterns = [
     path("", views.index, name="index"),
-]
\ No newline at end of file
+    # Read-only JSON API
+    path("api/hotels/", views.hotel_list, name="api-hotel-list"),
+    path("api/hotels/<int:pk>/", views.hotel_detail, name="api-hotel-detail"),
+    path("api/locations/", views.location_list, name="api-location-list"),
+    path("api/locations/<int:pk>/", views.location_detail, name="api-location-detail"),
+    path("api/amenities/", views.amenity_list, name="api-amenity-list"),
+    path("api/amenities/<int:pk>/", views.amenity_detail, name="api-amenity-detail"),
+    path("api/images/", views.image_list, name="api-image-list"),
+    path("api/images/<int:pk>/", views.image_detail, name="api-image-detail"),
+    # Sync versions of the async hotel endpoints
+    path("api/sync/hotels/", views.sync_hotel_list, name="api-sync-hotel-list"),
+    path("api/sync/hotels/<int:pk>/", views.sync_hotel_detail, name="api-sync-hotel-detail"),
+]
@@ -1,5 +1,261 @@
-from django.http import HttpResponse
+import json
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import aprefetch_related_objects
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET, require_safe
+
+from polls import cache, media, renditions
+from polls.models import Images
+from polls.serializers import (
+    HotelSerializer, LocationSerializer, AmenitySerializer, ImageSerializer)
+from polls.storage import image_storage
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Rows fetched (and prefetched for) per query while streaming a page
+CHUNK_SIZE = 200
 
 
 def index(request):
-    return HttpResponse("Hello, world. You're at the polls index.")
\ No newline at end of file
+    return HttpResponse("Hello, world. You're at the polls index.")
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def get_serializer(request, serializer_class):
+    fields = request.GET.get('fields')
+    return serializer_class(fields.split(',') if fields else None)
+
+
+def page_query(request, serializer_class):
+    """
+    Serializer and queryset of one page of a resource, ordered by id:
+    ``?limit=`` rows after ``?cursor=`` (the ``next`` URL of the previous
+    page), with the ``?fields=`` asked for. Raises ``ValueError`` with a
+    message for the client on bad parameters.
+    """
+    serializer = get_serializer(request, serializer_class)
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+        cursor = int(request.GET.get('cursor', 0))
+    except ValueError:
+        raise ValueError('limit and cursor must be integers.')
+    if limit < 1:
+        raise ValueError('limit must be at least 1.')
+    # One row more than the page tells whether there is a next page
+    queryset = serializer.get_queryset().filter(pk__gt=cursor).order_by('pk')[:limit + 1]
+    return serializer, queryset, limit
+
+
+def list_response(request, serializer_class, cache_key=None):
+    """A page of a resource, the JSON is written while the rows are read."""
+    try:
+        serializer, queryset, limit = page_query(request, serializer_class)
+    except ValueError as e:
+        return error(str(e))
+    chunks = stream_page(request, serializer, queryset, limit)
+    if cache_key is not None:
+        chunks = cache.cache_stream(cache_key, chunks)
+    return StreamingHttpResponse(chunks, content_type='application/json')
+
+
+def stream_page(request, serializer, queryset, limit):
+    encoder = DjangoJSONEncoder()
+    yield '{"results": ['
+    last = None
+    for position, obj in enumerate(queryset.iterator(chunk_size=CHUNK_SIZE)):
+        if position == limit:
+            break
+        if last is not None:
+            yield ','
+        yield encoder.encode(serializer.to_dict(obj))
+        last = obj
+    else:
+        # No extra row, this is the last page
+        last = None
+    yield page_end(request, last)
+
+
+async def astream_page(request, serializer, queryset, limit):
+    """``stream_page`` reading the rows with ``aiterator()``."""
+    encoder = DjangoJSONEncoder()
+    yield '{"results": ['
+    last = None
+    position = 0
+    async for obj in queryset.aiterator(chunk_size=CHUNK_SIZE):
+        if position == limit:
+            break
+        if last is not None:
+            yield ','
+        yield encoder.encode(serializer.to_dict(obj))
+        last = obj
+        position += 1
+    else:
+        last = None
+    yield page_end(request, last)
+
+
+def page_end(request, last):
+    """Closes the page, with the URL of the page after ``last`` if there is one."""
+    next_url = None
+    if last is not None:
+        params = request.GET.copy()
+        params['cursor'] = last.pk
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    return f'], "next": {json.dumps(next_url)}}}'
+
+
+def detail_response(request, serializer_class, pk):
+    try:
+        serializer = get_serializer(request, serializer_class)
+    except ValueError as e:
+        return error(str(e))
+    obj = get_object_or_404(serializer.get_queryset(), pk=pk)
+    return JsonResponse(serializer.to_dict(obj), encoder=DjangoJSONEncoder)
+
+
+def not_modified(request, entry):
+    """304 when the client's copy (``If-None-Match``/``If-Modified-Since``) of the cached entry is current."""
+    last_modified = int(entry.last_modified) if entry.last_modified is not None else None
+    return get_conditional_response(request, etag=entry.etag, last_modified=last_modified)
+
+
+def cached_response(request, entry):
+    return not_modified(request, entry) or HttpResponse(entry.body, content_type='application/json')
+
+
+def add_validators(response, entry=None):
+    """
+    Successful responses carry the validators of the cached entry, if
+    any, and must be revalidated before reuse.
+    """
+    if response.status_code in (200, 304):
+        if entry is not None:
+            response.headers['ETag'] = entry.etag
+            if entry.last_modified is not None:
+                response.headers['Last-Modified'] = http_date(entry.last_modified)
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def list_variant(request):
+    # Pages hold absolute next URLs, so the host is part of the variant
+    return f'{request.get_host()}?{request.GET.urlencode()}'
+
+
+# The hotel endpoints are async, for ASGI deployments (see
+# djangoAdminPipeline/asgi.py). The sync versions below serve the same
+# responses under api/sync/, for WSGI and for comparison with loadtest.
+
+@require_GET
+async def hotel_list(request):
+    key = await cache.ahotel_list_key(list_variant(request))
+    entry = await cache.aget_page(key)
+    if entry is not None:
+        return add_validators(cached_response(request, entry), entry)
+    # Streamed without validators, the next request gets them from the cache
+    try:
+        serializer, queryset, limit = page_query(request, HotelSerializer)
+    except ValueError as e:
+        return error(str(e))
+    return add_validators(StreamingHttpResponse(
+        cache.acache_stream(key, astream_page(request, serializer, queryset, limit)),
+        content_type='application/json'))
+
+
+@require_GET
+async def hotel_detail(request, pk):
+    try:
+        serializer = get_serializer(request, HotelSerializer)
+    except ValueError as e:
+        return error(str(e))
+
+    async def render():
+        hotel = await aget_object_or_404(
+            serializer.get_queryset(prefetch=False).with_last_change(), pk=pk)
+        await aprefetch_related_objects([hotel], *serializer.prefetch_lookups())
+        body = DjangoJSONEncoder().encode(serializer.to_dict(hotel))
+        return body, hotel.lastChange
+
+    entry = await cache.aget_hotel(pk, ','.join(serializer.names), render)
+    return add_validators(cached_response(request, entry), entry)
+
+
+@require_GET
+def sync_hotel_list(request):
+    key = cache.hotel_list_key(list_variant(request))
+    entry = cache.get_page(key)
+    if entry is not None:
+        return add_validators(cached_response(request, entry), entry)
+    return add_validators(list_response(request, HotelSerializer, cache_key=key))
+
+
+@require_GET
+def sync_hotel_detail(request, pk):
+    try:
+        serializer = get_serializer(request, HotelSerializer)
+    except ValueError as e:
+        return error(str(e))
+
+    def render():
+        hotel = get_object_or_404(serializer.get_queryset().with_last_change(), pk=pk)
+        body = DjangoJSONEncoder().encode(serializer.to_dict(hotel))
+        return body, hotel.lastChange
+
+    entry = cache.get_hotel(pk, ','.join(serializer.names), render)
+    return add_validators(cached_response(request, entry), entry)
+
+
+@require_GET
+def location_list(request):
+    return list_response(request, LocationSerializer)
+
+
+@require_GET
+def location_detail(request, pk):
+    return detail_response(request, LocationSerializer, pk)
+
+
+@require_GET
+def amenity_list(request):
+    return list_response(request, AmenitySerializer)
+
+
+@require_GET
+def amenity_detail(request, pk):
+    return detail_response(request, AmenitySerializer, pk)
+
+
+@require_GET
+def image_list(request):
+    return list_response(request, ImageSerializer)
+
+
+@require_GET
+def image_detail(request, pk):
+    return detail_response(request, ImageSerializer, pk)
+
+
+@require_safe
+def media_file(request, name):
+    """
+    An image file or one of its renditions, only while an ``Images`` row
+    uses the file: deleted images waiting for ``MediaCleanup`` and other
+    files under ``MEDIA_ROOT`` are not served.
+    """
+    prefix = renditions.original_prefix(name)
+    images = (Images.objects.filter(image__startswith=prefix) if prefix
+              else Images.objects.filter(image=name))
+    if not name.startswith('images/') or not images.exists():
+        raise Http404('No such image.')
+    try:
+        return media.serve(request, image_storage, name)
+    except (FileNotFoundError, SuspiciousFileOperation):
+        raise Http404('No such image.')